@@ -3,35 +3,71 @@
 
 import re
 import os
+import time
+import json
+import zlib
+import errno
+import hashlib
 import shutil
+import sqlite3
+import argparse
+import itertools
 import subprocess
+import multiprocessing
+from xml.sax.saxutils import escape, quoteattr
 from bs4 import BeautifulSoup
 
-## Tries to find docsetutil
+parser = argparse.ArgumentParser(description="Creates a Dash docset from the Python documentation. Run it in the folder where the docs live.")
+parser.add_argument("--jobs", type=int, default=1,
+                    help="how many processes parse and rewrite the pages, defaults to 1 which does it all in this process like before. "
+                         "Try the number of cpus (%d here) for a faster build" % multiprocessing.cpu_count())
+parser.add_argument("--benchmark", type=int, metavar="N", default=None,
+                    help="instead of making the docset, time finding the tokens in the first N pages with the old one walk per type and the single walk")
+parser.add_argument("--inventory", action="store_true", default=False,
+                    help="get the tokens from Sphinx's objects.inv instead of the index pages and the html of every page, the pages are then "
+                         "only read to add the anchors. Works with the output of newer Sphinx versions too")
+parser.add_argument("--cache", metavar="DIR", default=None,
+                    help="keep the rewritten pages and their tokens in this folder, keyed by the hash of the source page, and reuse them "
+                         "for the pages that didn't change. Use the same folder for every release and only the changed pages get processed. "
+                         "Nothing is ever removed from it, delete the folder to start over")
+args = parser.parse_args()
+
+## Tries to find docsetutil. If it's not there (it only exists on OS X with Xcode)
+## we create the docSet.dsidx search index ourselves
 possible_docsetutil_path = [
     "/Developer/usr/bin/docsetutil",
     "/Applications/Xcode.app/Contents/Developer/usr/bin/docsetutil",
 ]
 docsetutil_path = [path for path in possible_docsetutil_path if os.path.exists(path)]
 if len(docsetutil_path) == 0:
-    print "Could not find docsetutil. Please check for docsetutil's location and set it inside the script."
-    exit(1)
-
-docsetutil_path = docsetutil_path[0]
+    print "Could not find docsetutil, the docSet.dsidx search index will be created without it."
+    docsetutil_path = None
+else:
+    docsetutil_path = docsetutil_path[0]
 
 ## Script should run in the folder where the docs live
 source_folder = os.getcwd() + "/"
 
-## Find the Python version of the docs
+## Find the Python version of the docs. Newer Sphinx versions don't have the "v"
 python_version = None
 f = open(source_folder + "index.html", 'r')
 for line in f:
-    search = re.search("Python v([0-9.]+) documentation", line)
+    search = re.search("Python v?([0-9.]+) documentation", line, re.IGNORECASE)
     if search:
         python_version = search.group(1)
         break
 f.close()
 
+## Or from the header of objects.inv
+if python_version == None and os.path.exists(source_folder + "objects.inv"):
+    f = open(source_folder + "objects.inv", 'rb')
+    for i in range(4):
+        search = re.match("# Version: ([0-9.]+)", f.readline())
+        if search:
+            python_version = search.group(1)
+            break
+    f.close()
+
 if python_version == None:
     print "I could not find Python's version in the index.html file. Are you in the right folder??"
     exit(1)
@@ -39,8 +75,32 @@ if python_version == None:
 dest_folder = source_folder + ("python.%s.docset/" % python_version)
 
 
+def make_folder(folder):
+    """ Makes a folder and the ones above it, if they don't exist already """
+    try:
+        os.makedirs(folder)
+    except OSError as e:
+        ## Another worker might have just made it
+        if e.errno != errno.EEXIST:
+            raise
+
+
+## The kinds of <dl> that have tokens in them, and their type in the //apple_ref/cpp/TYPE/name strings.
+## The tokens of a page go in Tokens.xml in this order
+token_types = [
+    ("class", "cl"),
+    ("method", "clm"),
+    ("classmethod", "clm"),
+    ("function", "func"),
+    ("exception", "cl"),
+    ("attribute", "instp"),
+]
+token_type_index = dict((what, i) for i, (what, identifier) in enumerate(token_types))
+
+
 def is_something(tag, something):
-    """ Function to help BeautifulSoup find our tokens """
+    """ Function to help BeautifulSoup find our tokens. This and collect() are the old way of finding
+    them, one walk over the whole page per type, they are only used by --benchmark now """
     return (tag.name == "dt"
             and tag.has_key("id")
             and tag.parent.name == "dl"
@@ -58,14 +118,341 @@ def collect(soup, what, identifier, names):
         names.append(apple_ref)
 
 
-## Clean up first
-if os.path.exists(dest_folder):
-    shutil.rmtree(dest_folder)
+def add_token(soup, n, identifier, names):
+    """ Adds the anchor for a token in front of its <dt> and adds it to the names """
+    apple_ref = "//apple_ref/cpp/%s/%s" % (identifier, n["id"])
+    new_tag = soup.new_tag("a")
+    new_tag['name'] = apple_ref
+    n.insert_before(new_tag)
+    names.append(apple_ref)
+
+
+def collect_all(soup, names):
+    """ Collects the nodes of every type in token_types from a BeautifulSoup document, with one walk
+    over the <dt id="..."> tags. They are sorted by type so the names come out in the same order as
+    calling collect() for each type did """
+    found = [[] for t in token_types]
+    for n in soup.find_all("dt", id=True):
+        parent = n.parent
+        if parent.name == "dl" and parent.get("class"):
+            i = token_type_index.get(parent["class"][0])
+            if i is not None:
+                found[i].append(n)
+
+    for (what, identifier), whats in zip(token_types, found):
+        for n in whats:
+            add_token(soup, n, identifier, names)
+
+
+def benchmark_collect(hrefs):
+    """ Times finding the tokens in some pages with collect() for each type and with collect_all(), for --benchmark """
+    print "%-40s %8s %10s %10s %8s" % ("page", "tokens", "6 passes", "1 pass", "speedup")
+    total_old = total_new = 0.0
+    for href in hrefs:
+        html = open(source_folder + href).read()
+
+        soup = BeautifulSoup(html)
+        old_names = []
+        start = time.time()
+        for what, identifier in token_types:
+            collect(soup, what, identifier, old_names)
+        old_seconds = time.time() - start
+
+        soup = BeautifulSoup(html)
+        new_names = []
+        start = time.time()
+        collect_all(soup, new_names)
+        new_seconds = time.time() - start
+
+        if new_names != old_names:
+            print "[ERROR]: %s has different tokens with collect_all()" % href
+
+        total_old += old_seconds
+        total_new += new_seconds
+        print "%-40s %8d %9.1fms %9.1fms %7.1fx" % (href, len(new_names), old_seconds * 1000, new_seconds * 1000,
+                                                    old_seconds / max(new_seconds, 1e-9))
+
+    print "%-40s %8s %9.1fms %9.1fms %7.1fx" % ("total", "", total_old * 1000, total_new * 1000, total_old / max(total_new, 1e-9))
+
+
+## The roles in objects.inv that we make tokens for, and their type in the //apple_ref/cpp/TYPE/name strings
+inventory_types = {
+    "py:module": "cat",
+    "py:class": "cl",
+    "py:exception": "cl",
+    "py:method": "clm",
+    "py:classmethod": "clm",
+    "py:staticmethod": "clm",
+    "py:function": "func",
+    "py:attribute": "instp",
+}
+
+## One line of objects.inv: name, domain:role, priority, uri, display name. The name can have spaces in it
+inventory_line = re.compile(r"(.+?)\s+(\S+)\s+(-?\d+)\s+?(\S*)\s+(.*)")
+
+## The start tags with an id in a page, for inject_anchors()
+id_tag = re.compile(r"<[a-zA-Z][^<>]*?\sid=\"([^\"]+)\"")
+
+## The entries of objects.inv without a #fragment are the page itself, their anchors go at the top of the body
+body_tag = re.compile(r"<body\b[^>]*>", re.I)
+
+
+def read_inventory_lines(inventory_path):
+    """ Yields the lines of a Sphinx objects.inv file, decompressing it a piece at a time """
+    f = open(inventory_path, "rb")
+    if not f.readline().startswith("# Sphinx inventory version 2"):
+        raise ValueError("%s is not a version 2 Sphinx inventory" % inventory_path)
+
+    ## The project, the version and the line saying the rest is compressed
+    for i in range(3):
+        f.readline()
+
+    decompressor = zlib.decompressobj()
+    rest = ""
+    while True:
+        chunk = f.read(64 * 1024)
+        if not chunk:
+            break
+        lines = (rest + decompressor.decompress(chunk)).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    f.close()
+
+    for line in (rest + decompressor.flush()).split("\n"):
+        if line:
+            yield line
+
+
+def read_inventory(inventory_path):
+    """ Gets the tokens of every page from objects.inv, without looking at the pages.
+    Returns the pages dict (href -> names) and a dict of href -> {id in the page -> names}
+    that inject_anchors() uses to put the anchors in. The names of the entries without a fragment
+    (a uri ending in # or without one) are under "", those point at the top of the page """
+    pages = {}
+    page_anchors = {}
+    for line in read_inventory_lines(inventory_path):
+        search = inventory_line.match(line.rstrip())
+        if not search or search.group(2) not in inventory_types:
+            continue
+
+        name, role, priority, uri, display_name = search.groups()
+        if uri.endswith("$"):
+            uri = uri[:-1] + name
+        href, sep, fragment = uri.partition("#")
+
+        apple_ref = "//apple_ref/cpp/%s/%s" % (inventory_types[role], name)
+        if not href in pages:
+            pages[href] = []
+            page_anchors[href] = {}
+        pages[href].append(apple_ref)
+        page_anchors[href].setdefault(fragment, []).append(apple_ref)
+
+    return pages, page_anchors
+
+
+def inject_anchors(page):
+    """ The --inventory version of process_page(), we already have the names so the page is just
+    searched for the tags with the ids from objects.inv, and the anchors are put in front of them """
+    href, names = page
+    anchors = page_anchors[href]
+
+    def anchor_tags(fragment):
+        return "".join("<a name=%s></a>" % quoteattr(apple_ref) for apple_ref in anchors.get(fragment, []))
+
+    def add_anchors(search):
+        return anchor_tags(search.group(1)) + search.group(0)
+
+    html = id_tag.sub(add_anchors, open(source_folder + href).read())
+    if "" in anchors:
+        html = body_tag.sub(lambda search: search.group(0) + anchor_tags(""), html, 1)
+
+    newFile = dest_folder + href
+    make_folder(os.path.dirname(newFile))
+    newFile = open(newFile, "w")
+    newFile.write(html)
+    newFile.close()
+
+    return href, names
+
+
+## The links in the index files that discover_pages() looks for. They are compiled once and matched against
+## the raw bytes of the files, a buffer at a time, instead of decoding them and going line by line.
+## So they match the same things as they did on one line, none of them can match a newline: . doesn't,
+## and the character classes leave it out (a genindex href without a #fragment would run on into the next lines)
+modindex_link = re.compile("<a href=\"(.*)#.*?\"><tt class=\"xref\">(.*?)</tt>")
+genindex_link = re.compile("(?:<dt>|, )<a href=\"([^#\n]+).*?\">")
+library_link = re.compile("<a class=\"reference external\" href=\"([^#\"\n]+).*?\">")
+
+
+def scan_index(index_path, pattern, first_per_line=False):
+    """ Yields the matches of pattern in an index file, in one pass over the file, reading it a megabyte at a time.
+    The pattern must not be able to match a newline (see genindex_link), then it can't match across lines and
+    each buffer is cut at its last newline and the rest is kept for the next one. With first_per_line only the
+    first match of every line is yielded, like re.search on each line """
+    f = open(index_path, "rb")
+    rest = ""
+    while True:
+        chunk = f.read(1024 * 1024)
+        if not chunk:
+            break
+        end = chunk.rfind("\n") + 1
+        if end == 0:
+            rest += chunk
+            continue
+        for search in scan_buffer(rest + chunk[:end], pattern, first_per_line):
+            yield search
+        rest = chunk[end:]
+    f.close()
+
+    for search in scan_buffer(rest, pattern, first_per_line):
+        yield search
+
+
+def scan_buffer(buf, pattern, first_per_line):
+    """ Yields the matches of pattern in a buffer of whole lines, see scan_index """
+    if not first_per_line:
+        for search in pattern.finditer(buf):
+            yield search
+        return
+
+    start = 0
+    while start < len(buf):
+        end = buf.find("\n", start) + 1 or len(buf)
+        search = pattern.search(buf, start, end)
+        if search:
+            yield search
+        start = end
+
+
+def discover_pages(source_folder, modindex_path):
+    """ Finds the pages to make the docset from, in one pass over each of the module index, the general index
+    and the library index. Returns the pages dict, href -> names, with the module tokens from the module index in it """
+    pages = {}
+    ## The module index only ever used the first link on a line
+    sources = [
+        (modindex_path, modindex_link, "module", True),
+        ("genindex-all.html", genindex_link, "genindex", False),
+        ("library/index.html", library_link, "library", False),
+    ]
+    for index_file, pattern, kind, first_per_line in sources:
+        for search in scan_index(source_folder + index_file, pattern, first_per_line):
+            href = search.group(1)
+            if kind == "library":
+                href = "library/" + href
+                if "http://" in href or "https://" in href:
+                    continue
+
+            if not href in pages:
+                pages[href] = []
+
+            if kind == "module":
+                pages[href].append("//apple_ref/cpp/cat/%s" % search.group(2))
+
+    return pages
+
+
+def process_page(page):
+    """ Finds the tokens in one page, adds their anchors and writes the page to the docset.
+    With --jobs this runs in the worker processes, so it returns the names instead of changing the pages dict """
+    href, names = page
+    names = list(names)
+
+    soup = BeautifulSoup(open(source_folder + href))
+
+    collect_all(soup, names)
+
+    if len(names) > 0:
+        newFile = dest_folder + href
+        make_folder(os.path.dirname(newFile))
+        newFile = open(newFile, "w")
+        newFile.write(str(soup))
+        newFile.close()
+
+    return href, names
+
+
+## Maps the type in the //apple_ref/cpp/TYPE/name strings to the entry type
+## Dash uses in the searchIndex table
+dash_entry_types = {
+    "cat": "Module",
+    "cl": "Class",
+    "clm": "Method",
+    "func": "Function",
+    "instp": "Attribute",
+}
+
+
+## Bump this whenever the way pages are rewritten changes, so --cache doesn't reuse pages rewritten the old way
+cache_version = 1
+
+
+def get_cache_key(href, names):
+    """ The key of a page in the --cache, the hash of the source page and of everything else the
+    rewritten page and its names depend on """
+    key = hashlib.sha1()
+    key.update("%d %s %r\n" % (cache_version, "inventory" if args.inventory else "html", names))
+    if args.inventory:
+        key.update("%r\n" % sorted(page_anchors[href].items()))
+    f = open(source_folder + href, "rb")
+    key.update(f.read())
+    f.close()
+    return key.hexdigest()
+
+
+def get_cache_page_path(cache_folder, key):
+    """ Where the rewritten page with this key is kept in the --cache """
+    return os.path.join(cache_folder, "pages", key[:2], key + ".html")
+
+
+def load_cache_index(cache_folder):
+    """ Loads the names of every page in the --cache, key -> names """
+    index_path = os.path.join(cache_folder, "index.json")
+    if not os.path.exists(index_path):
+        return {}
+
+    f = open(index_path, "r")
+    cache_index = json.load(f)
+    f.close()
+
+    ## json gives us unicode strings back, everything else uses str
+    return dict((str(key), [name.encode("utf-8") for name in names]) for key, names in cache_index.items())
+
+
+def save_cache_index(cache_folder, cache_index):
+    """ Saves the names of every page in the --cache, see load_cache_index() """
+    f = open(os.path.join(cache_folder, "index.json"), "w")
+    json.dump(cache_index, f)
+    f.close()
+
+
+def write_sqlite_index(index_path, pages):
+    """ Creates Dash's docSet.dsidx search index straight from the pages dict, without docsetutil """
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    rows = []
+    seen = set()
+    for href in sorted(pages.keys()):
+        for name in pages[href]:
+            ## The anchor is the apple_ref itself, that's what collect() puts in the page
+            identifier, name_only = name.split("/", 5)[4:]
+            row = (name_only, dash_entry_types.get(identifier, identifier), "%s#%s" % (href, name))
+            if not row in seen:
+                seen.add(row)
+                rows.append(row)
+
+    connection = sqlite3.connect(index_path)
+    connection.execute("CREATE TABLE searchIndex(id INTEGER PRIMARY KEY, name TEXT, type TEXT, path TEXT)")
+
+    ## One transaction for all the rows, and the index is only created at the end
+    with connection:
+        connection.executemany("INSERT INTO searchIndex(name, type, path) VALUES (?, ?, ?)", rows)
+
+    connection.execute("CREATE UNIQUE INDEX anchor ON searchIndex (name, type, path)")
+    connection.commit()
+    connection.close()
 
-## Create all the necessary folder hierarchy
-os.makedirs(dest_folder + "Contents/Resources/Documents/")
-docset_folder = dest_folder
-dest_folder = dest_folder + "Contents/"
 
 ## Find the module's index file. It's different in Python's 3 docs
 possible_modindex_path = [
@@ -78,6 +465,32 @@ if len(modindex_path) == 0:
     exit(2)
 modindex_path = modindex_path[0]
 
+## Collect pages first
+page_anchors = {}
+if args.inventory:
+    start = time.time()
+    pages, page_anchors = read_inventory(source_folder + "objects.inv")
+    print "Read %d tokens on %d pages from objects.inv in %.0fms" % (sum(len(names) for names in pages.values()), len(pages),
+                                                                    (time.time() - start) * 1000)
+else:
+    start = time.time()
+    pages = discover_pages(source_folder, modindex_path)
+    print "Found %d unique pages in the index files in %.0fms" % (len(pages), (time.time() - start) * 1000)
+
+## With --benchmark we just time finding the tokens and stop, before anything gets deleted
+if args.benchmark:
+    benchmark_collect(sorted(pages.keys())[:args.benchmark])
+    exit(0)
+
+## Clean up first
+if os.path.exists(dest_folder):
+    shutil.rmtree(dest_folder)
+
+## Create all the necessary folder hierarchy
+os.makedirs(dest_folder + "Contents/Resources/Documents/")
+docset_folder = dest_folder
+dest_folder = dest_folder + "Contents/"
+
 ## Create Info.plist
 info = open(dest_folder + "Info.plist", "w")
 info.write("""<?xml version="1.0" encoding="UTF-8"?>
@@ -89,10 +502,12 @@ info.write("""<?xml version="1.0" encoding="UTF-8"?>
     <key>CFBundleName</key>
     <string>Python %s</string>
     <key>DocSetPlatformFamily</key>
-    <string>python</string>
+    <string>python</string>%s
 </dict>
 </plist>
-""" % (python_version, python_version))
+""" % (python_version, python_version, "" if docsetutil_path else """
+    <key>isDashDocset</key>
+    <true/>"""))
 info.close()
 
 ## Create Nodes.xml
@@ -136,73 +551,73 @@ tokens.write("""<?xml version="1.0" encoding="UTF-8"?>
 <Tokens version="1.0">
 """)
 
-## Collect pages first
-pages = {}
-
-## Collect pages from the modules index
-f = open(source_folder + modindex_path, 'r')
-for line in f:
-    search = re.search("<a href=\"(.*)#.*?\"><tt class=\"xref\">(.*?)</tt>", line)
-    if search:
-        href = search.group(1)
-        name = search.group(2)
-        if not href in pages:
-            pages[href] = []
-
-        apple_ref = "//apple_ref/cpp/cat/%s" % name
-        pages[href].append(apple_ref)
-
-f.close()
-
-## Collect pages from the general index
-f = open(source_folder + "genindex-all.html", 'r')
-for line in f:
-    for search in re.finditer("(<dt>|, )<a href=\"([^#]+).*?\">", line):
-        href = search.group(2)
-        if not href in pages:
-            pages[href] = []
-
-f.close()
-
-## Collect pages from the library index
-f = open(source_folder + "library/index.html", 'r')
-for line in f:
-    for search in re.finditer("<a class=\"reference external\" href=\"([^#\"]+).*?\">", line):
-        href = "library/" + search.group(1)
-        if not ("http://" in href or "https://" in href or href in pages):
-            pages[href] = []
-
-f.close()
-
-## Now write to tokens
-for href, names in pages.items():
-
-    soup = BeautifulSoup(open(source_folder + href))
-
-    collect(soup, "class", "cl", names)
-    collect(soup, "method", "clm", names)
-    collect(soup, "classmethod", "clm", names)
-    collect(soup, "function", "func", names)
-    collect(soup, "exception", "cl", names)
-    collect(soup, "attribute", "instp", names)
+## With --cache, find the pages that are the same as in an earlier build
+page_keys = {}
+cache_index = {}
+cached_pages = set()
+if args.cache:
+    start = time.time()
+    cache_index = load_cache_index(args.cache)
+    for href, names in pages.items():
+        key = page_keys[href] = get_cache_key(href, names)
+        if key in cache_index and (not cache_index[key] or os.path.exists(get_cache_page_path(args.cache, key))):
+            cached_pages.add(href)
+    print "Build cache: %d of %d pages are unchanged, checked in %.0fms" % (len(cached_pages), len(pages), (time.time() - start) * 1000)
+
+## Now write to tokens. With --jobs the pages are done by a pool, imap gives us the results
+## in the same order as pages.items() so Tokens.xml is the same as when it's done in this process.
+## The pool is created here so the workers get dest_folder pointing at the Documents folder
+pool = None
+page_function = inject_anchors if args.inventory else process_page
+changed_pages = [(href, names) for href, names in pages.items() if not href in cached_pages]
+if args.jobs > 1 and len(changed_pages) > 1:
+    pool = multiprocessing.Pool(args.jobs)
+    results = pool.imap(page_function, changed_pages)
+else:
+    results = itertools.imap(page_function, changed_pages)
+
+for href in pages.keys():
+
+    if href in cached_pages:
+        ## Take the page from the cache instead. It's copied and not linked, so changing the docset
+        ## afterwards can't change what the next build gets out of the cache
+        key = page_keys[href]
+        names = cache_index[key]
+        if len(names) > 0:
+            make_folder(os.path.dirname(dest_folder + href))
+            shutil.copyfile(get_cache_page_path(args.cache, key), dest_folder + href)
+    else:
+        href, names = next(results)
+        if args.cache:
+            key = page_keys[href]
+            cache_index[key] = names
+            if len(names) > 0:
+                cache_page_path = get_cache_page_path(args.cache, key)
+                make_folder(os.path.dirname(cache_page_path))
+                shutil.copyfile(dest_folder + href, cache_page_path)
+
+    pages[href] = names
 
     if len(names) > 0:
-        tokens.write("<File path=\"%s\">\n" % href)
+        tokens.write("<File path=%s>\n" % quoteattr(href))
         for name in names:
-            tokens.write("\t<Token><TokenIdentifier>%s</TokenIdentifier><Anchor>%s</Anchor></Token>\n" % (name, name))
+            tokens.write("\t<Token><TokenIdentifier>%s</TokenIdentifier><Anchor>%s</Anchor></Token>\n" % (escape(name), escape(name)))
         tokens.write("</File>\n")
 
-        newFile = dest_folder + href
-        if not os.path.exists(os.path.dirname(newFile)):
-            os.makedirs(os.path.dirname(newFile))
-        newFile = open(newFile, "w")
-        newFile.write(str(soup))
-        newFile.close()
+if pool:
+    pool.close()
+    pool.join()
 
 tokens.write("</Tokens>")
 tokens.close()
 
-subprocess.call([docsetutil_path, "index", docset_folder])
+if args.cache:
+    save_cache_index(args.cache, cache_index)
+
+if docsetutil_path:
+    subprocess.call([docsetutil_path, "index", docset_folder])
+else:
+    write_sqlite_index(docset_folder + "Contents/Resources/docSet.dsidx", pages)
 
 ## Cleanup
 os.remove(docset_folder + "Contents/Resources/Nodes.xml")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Builds a docset from a tiny documentation tree with create_docset.py and checks what ended up in it.
+## Run it with python 2 (python test_create_docset.py), or with pytest and $PYTHON2 pointing at a python 2 with bs4
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+import sys
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "create_docset.py")
+
+
+def find_python2():
+    """ create_docset.py is a python 2 script, so when the tests are run with python 3 it's run with
+    the python in $PYTHON2, or python2 from the PATH. None if there isn't one that has bs4 """
+    if sys.version_info[0] == 2:
+        return sys.executable
+
+    python_path = os.environ.get("PYTHON2") or shutil.which("python2")
+    if python_path and subprocess.call([python_path, "-c", "import bs4"], stdout=open(os.devnull, "w"),
+                                       stderr=subprocess.STDOUT) == 0:
+        return python_path
+    return None
+
+
+python_path = find_python2()
+
+## The documentation tree, path -> contents. The first genindex link has no #fragment, and the
+## link after it is on the next line, the scanner has to find both pages like the old line loop did
+fixture = {
+    "index.html": "<html><head><title>Overview &mdash; Python v2.7.18 documentation</title></head></html>\n",
+    "searchindex.js": "Search.setIndex({})\n",
+    "py-modindex.html": "<html><body><table>\n"
+                        "<tr><td><a href=\"library/os.html#module-os\"><tt class=\"xref\">os</tt></a></td></tr>\n"
+                        "</table></body></html>\n",
+    "genindex-all.html": "<html><body><dl>\n"
+                         "<dt><a href=\"glossary.html\">glossary</a></dt>\n"
+                         "<dt><a href=\"library/os.html#os.getcwd\">getcwd() (in module os)</a></dt>\n"
+                         "</dl></body></html>\n",
+    "library/index.html": "<html><body><ul>\n"
+                          "<li><a class=\"reference external\" href=\"os.html\">os</a></li>\n"
+                          "</ul></body></html>\n",
+    "glossary.html": "<html><head><title>Glossary</title></head><body>\n"
+                     "<dl class=\"attribute\"><dt id=\"glossary.term\">term</dt><dd>t</dd></dl>\n"
+                     "</body></html>\n",
+    "library/os.html": "<html><head><title>os</title></head><body>\n"
+                       "<dl class=\"function\"><dt id=\"os.getcwd\">getcwd()</dt><dd>g</dd></dl>\n"
+                       "</body></html>\n",
+    "_static/basic.css": "body {}\n",
+    "_static/default.css": "body {}\n",
+    "_images/a.png": "",
+}
+
+
+@unittest.skipUnless(python_path, "needs python 2 with bs4 to run create_docset.py, set $PYTHON2")
+class CreateDocsetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source_folder = tempfile.mkdtemp(prefix="pydocs")
+        for path, contents in fixture.items():
+            full_path = os.path.join(self.source_folder, path)
+            if not os.path.isdir(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            f = open(full_path, "w")
+            f.write(contents)
+            f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.source_folder)
+
+    def build(self):
+        """ Runs create_docset.py in the documentation tree, returns the rows of the search index """
+        subprocess.check_call([python_path, script_path], cwd=self.source_folder,
+                              stdout=open(os.devnull, "w"))
+
+        connection = sqlite3.connect(os.path.join(self.source_folder,
+                                                  "python.2.7.18.docset/Contents/Resources/docSet.dsidx"))
+        rows = connection.execute("SELECT name, type, path FROM searchIndex ORDER BY path").fetchall()
+        connection.close()
+        return rows
+
+    def test_genindex_link_without_fragment(self):
+        rows = self.build()
+        self.assertEqual(rows, [
+            (u"glossary.term", u"Attribute", u"glossary.html#//apple_ref/cpp/instp/glossary.term"),
+            (u"os", u"Module", u"library/os.html#//apple_ref/cpp/cat/os"),
+            (u"os.getcwd", u"Function", u"library/os.html#//apple_ref/cpp/func/os.getcwd"),
+        ])
+
+        documents_folder = os.path.join(self.source_folder, "python.2.7.18.docset/Contents/Resources/Documents/")
+        self.assertTrue(os.path.exists(documents_folder + "glossary.html"))
+        self.assertTrue(os.path.exists(documents_folder + "library/os.html"))
+
+
+if __name__ == "__main__":
+    unittest.main()
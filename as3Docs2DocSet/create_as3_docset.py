@@ -20,15 +20,44 @@ import subprocess
 import argparse
 import traceback
 import sys
+import json
+import hashlib
+import sqlite3
+import time
+import functools
+import cProfile
+import pickle
+import io
+import gzip
+import tarfile
+import collections
+import threading
+import tempfile
+import queue
+import mimetypes
+import http.server
 import urllib.parse
-from multiprocessing import Pool, Lock, Value, Manager
-from ctypes import c_int, c_wchar_p
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
+from multiprocessing import Pool
+import multiprocessing.util
+try:
+    # only used for the peak memory in the --profile report, which we just leave out if its not there (windows)
+    import resource
+except ImportError:
+    resource = None
 try:
     import bs4
     from bs4 import BeautifulSoup
 except ImportError as e:
     print("You need beautiful soup 4 in order to run this script! Get it from: http://www.crummy.com/software/BeautifulSoup/ (Error: {})".format(e))
     sys.exit(1)
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError as e:
+    print("You need lxml in order to run this script! Get it from: http://lxml.de (Error: {})".format(e))
+    sys.exit(1)
 
 
 
@@ -115,26 +144,50 @@ staticFiles = ["ajax-loader.gif",
 
 staticFolders = ["images"]
 
+# the css files in staticFiles that we change so the pages look right in dash, see getModifiedCss()
+modifiedCssFiles = ["filter-style.css", "style.css"]
+
+# maps the type in the //apple_ref/cpp/TYPE/name token strings to the entry type dash uses in the
+# searchIndex table of docSet.dsidx, see http://kapeli.com/docsets/
+dashEntryTypes = {"cl": "Class",
+    "clm": "Method",
+    "instp": "Property",
+    "clconst": "Constant",
+    "func": "Function",
+    "Event": "Event",
+    "Interface": "Interface",
+    "Package": "Package"}
+
+# the types that go in the compact token lists, see packTokenList(). A token's type is stored as its index in here
+tokenTypes = list(dashEntryTypes.keys())
+tokenTypeCodes = {refType: code for code, refType in enumerate(tokenTypes)}
+
+# the type code for a token that we couldn't store in the compact form, its apple ref is stored as is
+rawTokenCode = 255
+
+# the version of the manifest file that --incremental uses. Bump this whenever the scraping code changes
+# what tokens it finds, so an old manifest doesn't get used to skip pages that would now give different tokens
+manifestVersion = 1
+
 # multiprocessing variables and stuff
 # the pool is created later or else it doesn't know about asyncScrapePage
 
-# THIS IS WHERE WE GET ALL OF THE VARIABLES THAT HAVE TO BE ACCESSED FROM DIFFERENT PROCESSES
-# IF THEY ARN'T CREATED USING manager THEN IT WONT WORK
-manager = Manager()
-
-counter = manager.Value(c_int, 0)  # int, need lock for this since we load and incement. 
-                        # see http://stackoverflow.com/questions/1233222/python-multiprocessing-easy-way-to-implement-a-simple-counter
-counter.value = 1
-counterLock  = manager.Lock() 
-total = manager.Value(c_int, 0) # int, don't need lock as we set only once
-sourceFolder = manager.Value(c_wchar_p, "") # string, don't need lock for this, we set only once
-documentsFolder = manager.Value(c_wchar_p, "") # string , don't need lock for this, we set only once
+# these get set in every worker process by initScrapeWorker() when the pool is created. They are just
+# plain strings, we don't use a Manager anymore, every worker returns its (pageLink, tokenList) result
+# to the parent process instead of writing it to a shared dictionary.
+sourceFolder = None
+documentsFolder = None
+parserBackend = "bs4"
+profilePages = False # if True, asyncScrapePage returns how long each step of the page took, see --profile
+archivePages = False # if True, savePage() compresses the pages for the docset archive instead of writing them, see --archive
+pendingArchiveMembers = [] # the compressed pages that savePage() made, that asyncScrapePage hasn't returned yet
+archiveMtime = 0 # the timestamp of the pages in the archive, see getArchiveMtime()
+minifyPages = False # if True, savePage() runs the pages through minifyHtml() before saving them, see --minify
+pageWriter = None # the PageWriter that writes this worker's pages on a background thread, None to write them in savePage(), see --writeQueueSize
+pendingWriteErrors = [] # the error records of earlier pages that the PageWriter couldn't write, that asyncScrapePage hasn't returned yet
 
-# dictionary that will hold the pages
-# key is the html files path, and value is a list of 
-# tuple objects, the first value is the strings that will will be of the format //apple_ref/language/type/name
-# that identifies the various classes, properties, styles, etc inside each html file. The second is the 'anchor'
-pages = manager.dict()
+# with --archive, the pages are stored under this folder in the archive
+archiveDocumentsFolder = "as3.docset/Contents/Resources/Documents"
 
 
 def getUrlWithoutFragment(url):
@@ -221,41 +274,119 @@ def isPagesLink(tag):
         and tag.parent.has_attr("class") # short circut, if this is false we wont get keyerror on next line
         and tag.parent["class"][0] == "idxrow" )# class can have more then one attribute, so we use list syntax here
 
-def getPagesFromIndex(soup, pagesDict):
+def normalizePageLink(href):
+    ''' turns a href from one of the index pages into the path of the page we need to parse
+    @param href - the href of the <a> tag
+    @return the normalized path, without the fragment'''
+
+    urlWithoutFrag = getUrlWithoutFragment(href)
+
+    # resulting url without the fragment
+    # note: you have to use os.path.normpath here or else we get duplicate entries, cause we somehow get 
+    # "./String.html" and "String.html", which are the same file, but different paths!
+    return os.path.normpath(urlWithoutFrag)
+
+def getPageLinksFromIndex(soup):
     ''' goes through a all-index-LETTER.html file and gets all the links from it
     @param soup - the beautifulsoup object
-    @param pagesDict - the dictonary of pages that we are adding too.'''
+    @return a list of the normalized page links, this has duplicates in it since the index
+        links to the same page for every property/method/whatever on it'''
 
-    # get the list of <a> tags whose href property we need to add to the dict
+    # get the list of <a> tags whose href property we need
     tagList = soup.find_all(lambda tag: isPagesLink(tag))
-    
-    for tmpTag in tagList:
 
+    return [normalizePageLink(tmpTag["href"]) for tmpTag in tagList]
 
-        urlWithoutFrag = getUrlWithoutFragment(tmpTag["href"])
+class PageIndex:
+    ''' an index of every tag in a page, by tag name, id, class and the 'name' attribute. We build
+    this with one walk through the tree, and then everything that used to do a soup.find() with a lambda
+    (which walks the entire tree every time) just looks the tags up in here instead.
 
-        # resulting url without the fragment
-        # note: you have to use os.path.normpath here or else we get duplicate entries, cause we somehow get 
-        # "./String.html" and "String.html", which are the same file, but different paths!
-        result = os.path.normpath(urlWithoutFrag)
+    The lists are in document order, same as soup.find_all() would give us. Tags that get
+    decompose()'d after the index is built are skipped when we look things up.'''
 
-        # check to see if its in the dict already
-        if not result in pagesDict:
-            pagesDict[result] = [] # give it an empty list as a value for later on
-    
-def getTableTag(tableId, soup):
-    ''' gets a <table> tag from the bs4 soup with a specified id.
+    def __init__(self, soup):
+        ''' constructor
+        @param soup - the bs4 soup object of the html page that we are indexing'''
+
+        self.byTagName = {}
+        self.byId = {}
+        self.byClass = {}
+        self.byName = {}
+
+        for tag in soup.find_all(True):
+
+            self.byTagName.setdefault(tag.name, []).append(tag)
+
+            if tag.has_attr("id"):
+                self.byId.setdefault(tag["id"], []).append(tag)
+
+            if tag.has_attr("class"):
+                # class is a multi valued attribute, so index the tag under every one of them
+                for className in tag["class"]:
+                    self.byClass.setdefault(className, []).append(tag)
+
+            if tag.has_attr("name"):
+                self.byName.setdefault(tag["name"], []).append(tag)
+
+    def getTags(self, tagName=None, tagId=None, className=None, nameAttr=None):
+        ''' gets all the tags that match every one of the arguments that isn't None
+        @param tagName - the name of the tag, like "table" or "a"
+        @param tagId - the value of the id attribute
+        @param className - one of the values in the class attribute
+        @param nameAttr - the value of the name attribute
+        @return a list of bs4 tag objects, in document order'''
+
+        # start with the most specific list we have
+        if tagId is not None:
+            candidates = self.byId.get(tagId, [])
+        elif nameAttr is not None:
+            candidates = self.byName.get(nameAttr, [])
+        elif className is not None:
+            candidates = self.byClass.get(className, [])
+        else:
+            candidates = self.byTagName.get(tagName, [])
+
+        # don't use tag.decomposed here, for a tag that wasn't decomposed it falls through to Tag.__getattr__
+        # which does a find() for a child tag named "_decomposed"...
+        return [tag for tag in candidates if not tag.__dict__.get("_decomposed", False)
+            and (tagName is None or tag.name == tagName)
+            and (tagId is None or tag.get("id") == tagId)
+            and (className is None or className in tag.get("class", []))
+            and (nameAttr is None or tag.get("name") == nameAttr)]
+
+    def getTag(self, tagName=None, tagId=None, className=None, nameAttr=None):
+        ''' same as getTags() but only gets the first tag, like soup.find() would
+        @return the bs4 tag object or None'''
+
+        tagList = self.getTags(tagName, tagId, className, nameAttr)
+
+        return tagList[0] if tagList else None
+
+def isDescendantOf(tag, ancestorTag):
+    ''' checks to see if a tag is somewhere inside of another tag
+    @param tag - the bs4 tag we are checking
+    @param ancestorTag - the bs4 tag that we want tag to be inside of
+    @return boolean, whether tag is a descendant of ancestorTag'''
+
+    # use 'is', bs4 tags compare == by their contents, which is slow and not what we want
+    return any(parent is ancestorTag for parent in tag.parents)
+
+def getTableTag(tableId, pageIndex):
+    ''' gets a <table> tag from the page with a specified id.
 
     @param tableId - the id of the table that we want. this can either be a string or a list,
         if its a list, then we use all of the entries. 
-    @param soup - the bs4 soup object we are looking for, the html page
+    @param pageIndex - the PageIndex of the html page we are looking in
     @return the <table> tag or none.'''
 
-    return soup.find(lambda tag: tag.name == "table" 
-            and tag.has_attr("id") 
-            and tag["id"] in tableId) # this works if its a string or a list. 
+    for tag in pageIndex.getTags("table"):
+        if tag.has_attr("id") and tag["id"] in tableId: # this works if its a string or a list. 
+            return tag
+
+    return None
 
-def getTagListFormatOne(tableTag, tagToSearchFor, hiddenId):
+def getTagListFormatOne(tableTag, tagToSearchFor, hiddenId, pageIndex):
     '''this method gets a list of html tags that are inside a <table> and are
     of the following format:
     <table>
@@ -267,6 +398,7 @@ def getTagListFormatOne(tableTag, tagToSearchFor, hiddenId):
     @param tagToSearchFor - the tag's name to search for as a string. 
     @param hiddenId - the "id" of the <tr> tags that specifies that the whatever is hidden (as in inherited)
         and we don't want to include it.
+    @param pageIndex - the PageIndex of the html page the table is in
     @return a list of BS4 tag objects.'''
 
     # TODO: we should probably do something similar like with formatTwo where we can take multiple arguments 
@@ -276,16 +408,16 @@ def getTagListFormatOne(tableTag, tagToSearchFor, hiddenId):
     if tableTag.name == "table" and isinstance(tableTag, bs4.element.Tag):
 
         # find descendants of the table that match what we want
-        tmpList = tableTag.findAll(lambda tag: tag.name == tagToSearchFor 
-            and tag.has_attr("class")
-            and "signatureLink" in tag["class"] # want the signature link, not the 'type' link (like link to Boolean)
-            and tag.parent is not None
+        # want the signature link, not the 'type' link (like link to Boolean)
+        tmpList = [tag for tag in pageIndex.getTags(tagToSearchFor, className="signatureLink")
+            if tag.parent is not None
             and tag.parent.name == "td"  # make sure we have the right parent
             and tag.parent.has_attr("class") 
             and "summaryTableSignatureCol" in tag.parent["class"] 
             and tag.parent.parent is not None # we don't want hidden properties. (next three lines)
             and tag.parent.parent.has_attr("class") 
-            and hiddenId not in tag.parent.parent["class"])
+            and hiddenId not in tag.parent.parent["class"]
+            and isDescendantOf(tag, tableTag)]
 
         return tmpList
 
@@ -293,7 +425,7 @@ def getTagListFormatOne(tableTag, tagToSearchFor, hiddenId):
 
         raise ValueError("getTagListFormatOne(): the tableTag param was none or not a <table> tag! it was: {}".format(tableTag))
 
-def getTagListFormatTwo(tableTag, tagToSearchFor, hiddenId):
+def getTagListFormatTwo(tableTag, tagToSearchFor, hiddenId, pageIndex):
     '''this method gets a list of html tags that are inside a <table> and are
     of the following format:
     <table>
@@ -306,6 +438,7 @@ def getTagListFormatTwo(tableTag, tagToSearchFor, hiddenId):
     @param tagToSearchFor - the tag's name to search for as a string. 
     @param hiddenId - the "id" of the <tr> tags that specifies that the whatever is hidden (as in inherited)
         and we don't want to include it. can be a string or a list. 
+    @param pageIndex - the PageIndex of the html page the table is in
     @return a list of BS4 tag objects.'''
 
     if tableTag.name == "table" and isinstance(tableTag, bs4.element.Tag):
@@ -315,32 +448,30 @@ def getTagListFormatTwo(tableTag, tagToSearchFor, hiddenId):
         # if its a list then we have to have special syntax since we can't see if an array is inside an array
         if isinstance(hiddenId, list):
 
-            tmpList = tableTag.findAll(lambda tag: tag.name == tagToSearchFor
-                and tag.has_attr("class") 
-                and "signatureLink" in tag["class"]
-                and tag.parent is not None
+            tmpList = [tag for tag in pageIndex.getTags(tagToSearchFor, className="signatureLink")
+                if tag.parent is not None
                 and tag.parent.has_attr("class")
                 and "summarySignature" in tag.parent["class"]
                 and tag.parent.parent is not None # make sure we don't get none error
                 and tag.parent.parent.parent is not None # make sure we don't get non error
                 and tag.parent.parent.parent.name == "tr" # this is the element that has the 'hideWhatever' class
                 and tag.parent.parent.parent.has_attr("class")
-                and [x not in tag.parent.parent["class"] for x in hiddenId])
+                and [x not in tag.parent.parent["class"] for x in hiddenId]
+                and isDescendantOf(tag, tableTag)]
 
         else:
 
             # just a string, we can do it the normal way.
-            tmpList = tableTag.findAll(lambda tag: tag.name == tagToSearchFor
-                and tag.has_attr("class") 
-                and "signatureLink" in tag["class"]
-                and tag.parent is not None
+            tmpList = [tag for tag in pageIndex.getTags(tagToSearchFor, className="signatureLink")
+                if tag.parent is not None
                 and tag.parent.has_attr("class")
                 and "summarySignature" in tag.parent["class"]
                 and tag.parent.parent is not None # make sure we don't get none error
                 and tag.parent.parent.parent is not None # make sure we don't get non error
                 and tag.parent.parent.parent.name == "tr" # this is the element that has the 'hideWhatever' class
                 and tag.parent.parent.parent.has_attr("class")
-                and hiddenId not in tag.parent.parent.parent["class"])
+                and hiddenId not in tag.parent.parent.parent["class"]
+                and isDescendantOf(tag, tableTag)]
 
         return tmpList
 
@@ -348,6 +479,20 @@ def getTagListFormatTwo(tableTag, tagToSearchFor, hiddenId):
 
         raise ValueError("getTagListFormatTwo() the tableTag param was not a <table> tag! it was: {}".format(tableTag))
 
+def getTokenString(refType, pageName, memberName):
+    ''' makes the //apple_ref/cpp/TYPE/name string for a property/method/whatever on a page
+
+    @param refType - the reftype for this token for entry into tokens.xml, see http://kapeli.com/docsets/
+    @param pageName - name of the page we are on
+    @param memberName - the name of the property/method/whatever
+    @return the token string'''
+
+    # if we are doing a method or a function, then add the parens to the token's name
+    if refType == "clm" or refType == "func":
+        return "//apple_ref/cpp/{}/{}.{}()".format(refType, pageName, memberName)
+    else:
+        return "//apple_ref/cpp/{}/{}.{}".format(refType, pageName, memberName)
+
 def getTokenAnchorTupleListFromATags(tagList, refType, pageName):
     '''this method adds <a> tags to the list of tuples that we are going to 
     serialize into the tokens.xml file. Here, the a tags are like:
@@ -367,16 +512,9 @@ def getTokenAnchorTupleListFromATags(tagList, refType, pageName):
 
         if tag.name =="a" and isinstance(tag, bs4.element.Tag):
 
-            finalPageName = ""
-            # if we are doing a method or a function, then add the parens to the token's name
-            if refType == "clm" or refType == "func":
-                finalPageName = pageName + "." + str(tag.string) + "()"
-            else:
-                finalPageName = pageName + "." + str(tag.string)
-
             # convert NavigableString to a str object
             # also get rid of the # infront of the href, cause we don't write it to the tokens.xml file
-            tmp = ("//apple_ref/cpp/{}/{}".format(refType, finalPageName), tag["href"].lstrip("#"))
+            tmp = (getTokenString(refType, pageName, str(tag.string)), tag["href"].lstrip("#"))
             tokenList.append(tmp)
 
         else:
@@ -409,17 +547,9 @@ def getTokenAnchorTupleListFromSpanTags(tagList, refType, pageName, anchorPrefix
 
         if tag.name =="span" and isinstance(tag, bs4.element.Tag):
 
-            finalPageName = ""
-            # if we are doing a method or a function, then add the parens to the token's name
-            if refType == "clm" or refType == "func":
-                finalPageName = pageName + "." + str(tag.string) + "()"
-            else:
-                finalPageName = pageName + "." + str(tag.string)
-
-
             # convert NavigableString to a str object
             # since we dont have a href we need to create the anchor by adding the anchorPrefix + : + the tag's string value
-            tmp = ("//apple_ref/cpp/{}/{}".format(refType, finalPageName), "{}:{}".format(anchorPrefix, str(tag.string)))
+            tmp = (getTokenString(refType, pageName, str(tag.string)), "{}:{}".format(anchorPrefix, str(tag.string)))
             tokenList.append(tmp)
 
         else:
@@ -428,7 +558,7 @@ def getTokenAnchorTupleListFromSpanTags(tagList, refType, pageName, anchorPrefix
 
     return tokenList
 
-def getClassTypeTupleFromClassSignature(soup, pageName):
+def getClassTypeTupleFromClassSignature(pageIndex, pageName):
     '''every class page has a class signature at the top, looking like
 
     Interface public interface IContentLoader extends IEventDispatcher
@@ -439,7 +569,7 @@ def getClassTypeTupleFromClassSignature(soup, pageName):
     won't have an anchor, since there really isn't anything useful to anchor to, it will just 
     take them to the page i guess
 
-    @param soup - the bs4 object
+    @param pageIndex - the PageIndex of the html page
     @param pageName - name of the page
     @returns the tuple that we add to the token list'''
 
@@ -449,9 +579,7 @@ def getClassTypeTupleFromClassSignature(soup, pageName):
 
     try:
         # find the <td> tag that has the class signature
-        tmp = soup.find(lambda tag: tag.name == "td" 
-            and tag.has_attr("class") 
-            and "classSignature" in tag["class"])
+        tmp = pageIndex.getTag("td", className="classSignature")
 
         # now the type of this class (whether its a package/interface) is the <td> element 
         # that is right before this, so we use previous_sibling
@@ -468,6 +596,13 @@ def getClassTypeTupleFromClassSignature(soup, pageName):
         return None
 
     # continue as normal
+    return getClassTypeTuple(classType, pageName)
+
+def getClassTypeTuple(classType, pageName):
+    ''' gets the (appleref, anchor) tuple for a class page, see getClassTypeTupleFromClassSignature()
+    @param classType - the lowercase text of the 'title label' next to the class signature
+    @param pageName - name of the page
+    @returns the tuple that we add to the token list'''
 
     # return token string and anchor depending on the class type
     if  classType == "interface":
@@ -484,27 +619,26 @@ def getClassTypeTupleFromClassSignature(soup, pageName):
         raise ValueError("unknown class type! {}".format(classType))
 
 # lambda that we use in addApplerefToPackageDetailPage
-findTdElInTable = (lambda tag: tag.name == "a"
-    and tag.parent is not None
+findTdElInTable = (lambda tag: tag.parent is not None
     and tag.parent.name == "td"
     and tag.parent.has_attr("class") 
     and "summaryTableSecondCol" in tag.parent["class"])
 
 # lambda that we use in addApplerefToPackageDetailPage
-findTdElInTableInterface = (lambda tag: tag.name == "a"
-    and tag.parent is not None
+findTdElInTableInterface = (lambda tag: tag.parent is not None
     and tag.parent.name == "i"
     and tag.parent.parent is not None
     and tag.parent.parent.name == "td"
     and tag.parent.parent.has_attr("class") 
     and "summaryTableSecondCol" in tag.parent.parent["class"])
 
-def addApplerefToPackageDetailPage(tableTag, tokenType):
+def addApplerefToPackageDetailPage(tableTag, tokenType, pageIndex):
     ''' this method adds the appleref string after the list of tags that we are given
     after searching the table tag we are given as the argument tableTag, for package-detail.html pages 
     @param tableTag  - the table tag bs4 object that we are given and search through
     @param tokenType - the type of the token that we put in the appleref link, like clconst, cl, etc, 
-        see http://kapeli.com/docsets/ for all of them'''
+        see http://kapeli.com/docsets/ for all of them
+    @param pageIndex - the PageIndex of the html page the table is in'''
 
     # make sure the tag isn't none, its None if there wasn't a table in that page (as in the page doesn't
     # have constants, functions, etc)
@@ -516,9 +650,9 @@ def addApplerefToPackageDetailPage(tableTag, tokenType):
         containerList = None
         if tokenType == "Interface":
             # use different lambda to find the <a> links if it is an interface
-            containerList = tableTag.find_all(findTdElInTableInterface)
+            containerList = [tag for tag in pageIndex.getTags("a") if findTdElInTableInterface(tag) and isDescendantOf(tag, tableTag)]
         else:
-            containerList = tableTag.find_all(findTdElInTable)
+            containerList = [tag for tag in pageIndex.getTags("a") if findTdElInTable(tag) and isDescendantOf(tag, tableTag)]
 
         for tmpEl in containerList:
             tmpNewTag = BeautifulSoup().new_tag("a")
@@ -531,7 +665,17 @@ def addApplerefToPackageDetailPage(tableTag, tokenType):
 
 
 
-def modifyAndSaveHtml(soup, destinationFile, tokenList):
+def getTableTagInContainer(tableId, containerTag, pageIndex):
+    ''' gets the first <table> tag with the specified id that is inside of containerTag
+    @param tableId - the id of the table we want
+    @param containerTag - the bs4 tag that the table has to be inside of
+    @param pageIndex - the PageIndex of the html page
+    @return the <table> tag or None'''
+
+    return next((tag for tag in pageIndex.getTags("table", tagId=tableId)
+        if isDescendantOf(tag, containerTag)), None)
+
+def modifyAndSaveHtml(soup, destinationFile, tokenList, pageIndex, timings=None):
     '''takes a html file from the documentation, and we remove certain elements 
     and modify some attributes to make it so it actually views properly in the 
     dash viewer. This method also inserts the appleref anchor links so dash can 
@@ -540,9 +684,16 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
     @param soup - the bs4 object we are using to modify the html and save it to the new location
     @param destinationFile - where we are saving the modified html
     @param tokenList - the list of tuples, of the form (appleRef, anchor) for the current page
-        so that we can add appleref anchor links on the webpage.'''
+        so that we can add appleref anchor links on the webpage.
+    @param pageIndex - the PageIndex we made for the soup, so we don't have to search the whole page
+        for every element we want to remove or modify
+    @param timings - if not None, a dictionary that we put how many seconds turning the soup back into html took into,
+        as "serialize", and how many seconds writing the file took, as "write"
+    @return a list of warnings, one for every token whose anchor we couldn't find in the page. Each one is
+        a dictionary with the keys "page", "token", "anchor" and "message"'''
 
     pageSoup = soup
+    warningList = []
 
     # find the following things and remove them:
     # 1 - div id "filter_panel_float" , the thing that is above the page title (has package/clas filters)
@@ -550,46 +701,36 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
     # 3 - div id mainleft # stuff on the left we dont want
 
     # 1
-    filterTag = pageSoup.find(lambda tag: tag.name == "div" 
-        and tag.has_attr("id")
-        and tag["id"] ==  "filter_panel_float")
+    filterTag = pageIndex.getTag("div", tagId="filter_panel_float")
 
     if filterTag:
         filterTag.decompose() # deletes the tag
 
     # 2
-    splitTag = pageSoup.find(lambda tag: tag.name == "div"
-        and tag.has_attr("id")
-        and tag["id"] == "splitter"
-        and tag.has_attr("class")
-        and tag["class"] == "splitter")
+    splitTag = next((tag for tag in pageIndex.getTags("div", tagId="splitter")
+        if tag.has_attr("class")
+        and tag["class"] == "splitter"), None)
 
     if splitTag:
         splitTag.decompose() # deletes the tag
 
     # 3
-    leftTag = pageSoup.find(lambda tag: tag.name == "div"
-        and tag.has_attr("class")
-        and tag["class"] == "mainleft"
-        and tag.has_attr("id")
-        and tag["id"] == "toc") # if javascript is on, then it just brings back this element, wtf?
+    leftTag = next((tag for tag in pageIndex.getTags("div", tagId="toc")
+        if tag.has_attr("class")
+        and tag["class"] == "mainleft"), None) # if javascript is on, then it just brings back this element, wtf?
 
     if leftTag:
         leftTag.decompose() # delete tag
 
     # now find the  maincontainer div and delete the style attribute cause its set to none by default
-    mainTag = pageSoup.find(lambda tag: tag.name == "div"
-        and tag.has_attr("id")
-        and tag["id"] == "maincontainer"
-        and tag.has_attr("style"))
+    mainTag = next((tag for tag in pageIndex.getTags("div", tagId="maincontainer")
+        if tag.has_attr("style")), None)
 
     if mainTag:
         del mainTag["style"] # delete style attribute
 
     # get rid of the search bar in the top right
-    searchTag = pageSoup.find(lambda tag: tag.name == "form"
-        and tag.has_attr("class")
-        and "searchFormION" in tag["class"]) # i have to say "in" because class is a multi valued attribute
+    searchTag = pageIndex.getTag("form", className="searchFormION") # class is a multi valued attribute, getTag() handles that
 
     if searchTag:
         searchTag.decompose() # delete tag
@@ -597,10 +738,9 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
 
     # make it so all 'inherited' properties/methods are shown by default since we are not going to be able to use JS. 
     # delete this if you want to use js and have the normal arrow showing hide/show inherited stuff
-    inheritedTags = pageSoup.find_all(lambda tag: (tag.name == "tr"
-        or tag.name == "table") # tables can have this too
-        and tag.has_attr("class")
-        and [not x.startswith("hide") for x in tag["class"]])
+    inheritedTags = [tag for tag in pageIndex.getTags("tr") + pageIndex.getTags("table") # tables can have this too
+        if tag.has_attr("class")
+        and [not x.startswith("hide") for x in tag["class"]]]
 
     if inheritedTags:
         for tag in inheritedTags:
@@ -620,10 +760,8 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
     # note that there are 'two' tags with the class "showHideLinks", the one with
     # div tags as children is the one we want. (the other one, with <a> tags, is a link that usually says
     # "click for more information on <something>")
-    showHideTags = pageSoup.find_all(lambda tag: tag.name == "div"
-        and tag.has_attr("class")
-        and "showHideLinks" in tag["class"]
-        and delShowHideTagsHelper(tag)) # use helper method
+    showHideTags = [tag for tag in pageIndex.getTags("div", className="showHideLinks")
+        if delShowHideTagsHelper(tag)] # use helper method
 
     if showHideTags:
         for iterTag in showHideTags:
@@ -636,10 +774,18 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
 
         if anchorLink != "": # don't do this if we don't have an anchor
 
-            # find the anchor link in the webpage
-            anchorTag = pageSoup.find(lambda tag: tag.name == "a"
-                and tag.has_attr("name")
-                and tag["name"] == anchorLink)
+            # find the anchor link in the webpage. The PageIndex has every tag by its name attribute
+            # so this is a dictionary lookup instead of searching the entire page for every token
+            anchorTag = pageIndex.getTag("a", nameAttr=anchorLink)
+
+            if anchorTag is None:
+
+                # the token still goes in Tokens.xml, dash just takes you to the top of the page for it
+                warningList.append({"page": destinationFile,
+                    "token": appleRef,
+                    "anchor": anchorLink,
+                    "message": "could not find the <a name=\"{}\"> anchor for the token {}".format(anchorLink, appleRef)})
+                continue
 
             # add new anchor link tag right after the one we found.
             newTag = pageSoup.new_tag("a")
@@ -650,9 +796,9 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
     # hidden in a <div style="display:none"> tag. So we will just remove all divs that have display:none cause 
     # we wont see them anyway! This also includes mainContainer but we delete that attribute earlier in this
     # method so its fine
-    displayNoneTags = pageSoup.find_all(lambda tag: tag.name == "div"
-        and tag.has_attr("style")
-        and "style:none" in tag['style'])
+    displayNoneTags = [tag for tag in pageIndex.getTags("div")
+        if tag.has_attr("style")
+        and "style:none" in tag['style']]
     if displayNoneTags:
         for iterTag in displayNoneTags:
             iterTag.decompose()
@@ -663,429 +809,2194 @@ def modifyAndSaveHtml(soup, destinationFile, tokenList):
     if os.path.basename(destinationFile) == "package-detail.html":
 
         # find the div tag that has all the table tags.
-        tableTagContainer = pageSoup.find(lambda tag: tag.name == "div"
-            and tag.has_attr("class")
-            and "content" in tag["class"])
+        tableTagContainer = pageIndex.getTag("div", className="content")
 
         # get constants
-        constantTag = tableTagContainer.find(lambda tag: tag.name == "table"
-            and tag.has_attr("id")
-            and tag["id"] == "summaryTableIdConstant")
-        addApplerefToPackageDetailPage(constantTag, "clconst") # add after if any links exist
+        constantTag = getTableTagInContainer("summaryTableIdConstant", tableTagContainer, pageIndex)
+        addApplerefToPackageDetailPage(constantTag, "clconst", pageIndex) # add after if any links exist
 
         # get classes
-        classesTag = tableTagContainer.find(lambda tag: tag.name == "table"
-            and tag.has_attr("id")
-            and tag["id"] == "summaryTableIdClass")
-        addApplerefToPackageDetailPage(classesTag, "cl") # add after if any links exist
+        classesTag = getTableTagInContainer("summaryTableIdClass", tableTagContainer, pageIndex)
+        addApplerefToPackageDetailPage(classesTag, "cl", pageIndex) # add after if any links exist
 
         # get functions
-        functionsTag = tableTagContainer.find(lambda tag: tag.name == "table"
-            and tag.has_attr("id")
-            and tag["id"] == "summaryTableIdFunction")
-        addApplerefToPackageDetailPage(functionsTag, "func") # add after if any links exist
+        functionsTag = getTableTagInContainer("summaryTableIdFunction", tableTagContainer, pageIndex)
+        addApplerefToPackageDetailPage(functionsTag, "func", pageIndex) # add after if any links exist
 
         # get interfaces
-        interfacesTag = tableTagContainer.find(lambda tag: tag.name == "table"
-            and tag.has_attr("id")
-            and tag["id"] == "summaryTableIdInterface")
-        addApplerefToPackageDetailPage(interfacesTag, "Interface") # add after if any links exist
+        interfacesTag = getTableTagInContainer("summaryTableIdInterface", tableTagContainer, pageIndex)
+        addApplerefToPackageDetailPage(interfacesTag, "Interface", pageIndex) # add after if any links exist
 
-    # make sure we have folder heirarchy or else we get no such file/directory
-    if not os.path.exists(os.path.split(destinationFile)[0]):
-        os.makedirs(os.path.split(destinationFile)[0]) # creates up to leaf directory, aka the html file
+    serializeStartTime = time.perf_counter()
 
-    # now write the modified soup to the destination dir
-    with open(destinationFile, "w", encoding="utf-8") as f:
+    html = str(pageSoup)
 
-        f.write(str(pageSoup))
+    writeStartTime = time.perf_counter()
 
+    # now write the modified soup to the destination dir
+    savePage(destinationFile, html, timings)
 
-def delShowHideTagsHelper(tag):
-    ''' helper method to help us determine if a <div> tag is the correct tag to delete
-    when we are getting rid of the "show/hide inherited whatever" tags.
+    if timings is not None:
+        timings["serialize"] = writeStartTime - serializeStartTime
+        timings["write"] = time.perf_counter() - writeStartTime
 
-    @param tag - the tag that BS4 gives us when filtering
-    @return boolean, whether we want to delete this tag or not.
-    '''
-    for tag in tag.contents:            
-        if tag.name == "a":
-            return False
-    return True
+    return warningList
 
-def trouble(message):
-    ''' prints an error message and exits with status 1
-    @param message - the error message'''
+# the parts of a page that minifyHtml() leaves alone, whitespace matters in <pre> and <textarea>, and
+# we don't try to minify javascript
+minifyProtectedRegex = re.compile(r"(<pre\b.*?</pre\s*>|<textarea\b.*?</textarea\s*>|<script\b.*?</script\s*>)", re.IGNORECASE | re.DOTALL)
 
-    print(message + "\n")
-    # this fails if no exception is active...
-    try:
-        printTraceback()
-    except Exception as e:
-        pass
-    sys.exit(1)
+# the inline scripts that only work when the page is inside the frameset of the original documentation,
+# they just throw errors in Dash
+minifyDeadScriptRegex = re.compile(r"<script\b[^>]*>(?:(?!</script).)*?\bloadClassListFrame\b.*?</script\s*>", re.IGNORECASE | re.DOTALL)
 
+# start tags, quoted attribute values can have a > in them. minifyAttributeRegex goes through the attributes of a start tag
+# one at a time, so the text inside an attribute value (like title="set onclick='...'") is never taken for an attribute
+minifyStartTagRegex = re.compile(r"""<[a-zA-Z][^\s/>]*(?:\s+[^\s"'<>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'<>]+))?|\s*/)*\s*>""", re.ASCII)
+minifyTagNameRegex = re.compile(r"<[^\s/>]*")
+minifyAttributeRegex = re.compile(r"""(\s+)([^\s"'<>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'<>]+)))?""", re.ASCII)
 
-def copyAndModifyStaticFilesToDocs(srcFolder, destFolder):
-    ''' copies static files to the Documents folder, that don't get
-    copied automatically during our script run. Css files, html files,etc.
-    For a few CSS files that we need to modify, we modify them here.
+# the <style> blocks and their rules, see getMinifiedStyleBlock()
+minifyStyleBlockRegex = re.compile(r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.IGNORECASE | re.DOTALL)
+minifyCssRuleRegex = re.compile(r"([^{}]+)\{([^{}]*)\}")
+minifyCssSelectorNameRegex = re.compile(r"([.#])(-?[_a-zA-Z][_a-zA-Z0-9-]*)")
 
-    @param srcFolder - folder that we are copying stuff from
-    @param destFolder - the folder we are copying stuff too'''
+# only html whitespace, \s would also match the &nbsp; characters that bs4 gives us in the strings
+minifyWhitespaceRegex = re.compile(r"[ \t\r\n\f]+")
 
-    # copy all of the index files from our htmlPagesToParse list at the top 
-    # of the script
-    for entry in htmlPagesToParse:
+def getMinifiedWhitespace(match):
+    ''' replacement function for minifyWhitespaceRegex, a run of whitespace becomes one newline if it had a newline
+    in it (so the pages still have lines) or one space otherwise
+    @param match - the match object
+    @return the replacement string'''
 
-        shutil.copy2(os.path.join(srcFolder, entry), os.path.join(destFolder, entry))
+    return "\n" if "\n" in match.group(0) else " "
 
+def getStartTagAttributes(startTag):
+    ''' goes through the attributes of a start tag that minifyStartTagRegex matched
+    @param startTag - the start tag, like <a href="x" onclick="y">
+    @return a list of (match, lowercase name, value) tuples, where match.group(0) is the whole attribute with the whitespace
+        in front of it, and value is None if the attribute doesn't have one'''
 
-    # copy the static to the documents directory
-    for entry in staticFiles:
+    nameEnd = minifyTagNameRegex.match(startTag).end()
+    attributeList = []
 
-        specialEntries = ["filter-style.css", "style.css"]
+    for match in minifyAttributeRegex.finditer(startTag, nameEnd, len(startTag) - 1):
+        value = next((group for group in match.groups()[2:] if group is not None), None)
+        attributeList.append((match, match.group(2).lower(), value))
 
-        # have special cases for some css files
-        if entry in specialEntries :
+    return attributeList
 
-            # here we change the css top property to be smaller so we dont have a big gap at the top
-            tmpCss = None
-            with open(os.path.join(srcFolder, entry), "r", encoding="utf-8") as f:
-                tmpCss = f.read()
+def getMinifiedStartTag(match):
+    ''' replacement function for minifyStartTagRegex, removes the event handler attributes (onclick and such) and
+    the empty style attributes from a start tag
+    @param match - the match object
+    @return the start tag without those attributes'''
 
-            if entry == "filter-style.css":
-                # change the top property, as suggested by Kapeli
-                tmpCss = re.sub("top:.*?;", "top:0px", tmpCss)
-            elif entry == "style.css":
+    startTag = match.group(0)
+    nameEnd = minifyTagNameRegex.match(startTag).end()
+    attributeList = getStartTagAttributes(startTag)
 
-                # get rid of the header, as suggested by Kapeli
-                tmpCss = re.sub(".titleTable{.*}",".titleTable{width:100%; display:none}", tmpCss)
+    keptList = [attribute.group(0) for attribute, name, value in attributeList
+        if not name.startswith("on") and not (name == "style" and value == "")]
 
-                # remove overflow:hidden so the pages scroll properly in dash
-                tmpCss = re.sub("overflow:hidden;?", "", tmpCss)
+    # whatever is after the last attribute is whitespace and maybe the / of a self closing tag
+    tagEnd = attributeList[-1][0].end() if attributeList else nameEnd
+    selfClosing = "/" if "/" in startTag[tagEnd:] else ""
 
-            # write modified file to dest directory
-            with open(os.path.join(destFolder, entry), "w", encoding="utf-8") as f:
-                f.write(tmpCss)
+    return startTag[:nameEnd] + "".join(keptList) + selfClosing + ">"
 
-        else:
-            # normal file, just copy it to dest directory
-            shutil.copy2(os.path.join(srcFolder, entry), os.path.join(destFolder, entry))
+def getMinifiedStyleBlock(styleText, classNames, idNames):
+    ''' removes the rules from a <style> block whose selectors all use a class or an id that isn't in the page.
+    Blocks with at-rules like @media in them are left alone, we only understand plain rules.
+    @param styleText - the text inside the <style> tag
+    @param classNames - a set of the class names used in the page
+    @param idNames - a set of the ids used in the page
+    @return the new text for the <style> tag'''
 
-    # copy static folders
-    for entry in staticFolders:
+    if "@" in styleText:
+        return styleText
 
-        shutil.copytree(os.path.join(srcFolder, entry), os.path.join(destFolder, entry))
+    def getRule(match):
 
+        for selector in match.group(1).split(","):
 
-def asyncScrapePage(dictKey):
-    ''' we are moving the majority of the code into here so we can use 
-    multiprocessing.Pool and have mutliple processes do the scraping.
-    So multiple processes will be executing this function, all of the multiprocessing
-    variables are defined before makeDocset()
-    @param dictKey - the key to the 'pages' dictionary that we get passed in by map
-     we use this to access the actual shared list in 'pages' that we can modify and share between
-     processes'''
-
-    # now we need to iterate through the pages dictionary and parse each 'pageLink',
-    # adding the token string to the list that is the value for every key in the pages dict
-    # the things that go in the list are the '//apple_ref/cpp/func/PyByteArray_FromObject'
-    # type strings. see http://kapeli.com/docsets/
-    #
-    # Type Mappings:
-    #
-    # Constant Static Property -> constant (clconst)
-    # Property-> property (instp)
-    # protected properties -> property (instp)
-    # Skin Part -> property (instp)
-    # skin states -> property (instp)
-    # effects -> property (instp)
-    # Event -> Event (Event)
-    # Class -> class (cl)
-    # method -> method (clm)
-    # protected method -> method (clm)
-    # Interface, package -> Interface (Interface)
-    # Style -> property (instp)
-    # mobile theme styles -> property (instp)
-    # Package -> Package (Package)
+            # a selector can match if every class and id in it is in the page
+            if all((name in classNames if kind == "." else name in idNames) for kind, name in minifyCssSelectorNameRegex.findall(selector)):
+                return match.group(0)
 
-    try:
+        return ""
 
-        pageLink = dictKey
-        tokenList = [] # need to assign this back to our shared list in the pages dict for it to properly 
-        # sync between processes
+    return minifyCssRuleRegex.sub(getRule, styleText)
 
-        # here we use the same soup object for scraping and passing to modifyAndSaveHtml to save processing time
-        soup = None
+def minifyHtml(html):
+    ''' makes a rewritten page smaller for --minify, without changing how it looks in Dash. Removes the
+    inline scripts that need the frameset (see minifyDeadScriptRegex) and the onclick="..." and such event handlers,
+    since those call the same javascript. Removes the <style> rules that can't match anything in the page and
+    empty style attributes, and collapses whitespace everywhere except <pre>, <textarea> and <script>.
+    The anchors and everything else Dash uses are left alone.
+    @param html - the page as a string
+    @return the minified page as a string'''
 
-        # scrape the page and get the tokens
-        with open(os.path.join(sourceFolder.value, pageLink), "r", encoding="utf-8") as f:
+    html = minifyDeadScriptRegex.sub("", html)
 
+    # split() with a group in the pattern gives us the protected parts at the odd indexes, the text in them
+    # is never touched (though the tags inside a <pre> still count for the class and id names below)
+    partList = minifyProtectedRegex.split(html)
 
-            pid = None
-            if hasattr(os, 'getppid'):  # only available on Unix
-                pid = os.getppid()
-            pid = os.getpid()
-            # since this function gets called in different processes we need to make sure
-            # that the counter isnt locked (since counter is a Value, like an atomic variable in java)
-            with counterLock:
-                print("PID: {} - Parsing file {}/{}: {}".format(pid, counter.value, total.value, pageLink))
-                counter.value += 1
+    classNames = set()
+    idNames = set()
 
+    for i, part in enumerate(partList):
 
-            # make the beautifulsoup object that reprsents the html
-            soup = BeautifulSoup(f)
+        # the contents of a <script> or <textarea> are text, not tags
+        if i % 2 == 1 and not part[:4].lower() == "<pre":
+            continue
 
-        # name of the page/class, the big "title" thing on the grey bar, like "JSON" or "Top Level"
-        # this also seems to have a "non breaking backspace" at the end....strip it off
-        # 6/15/12 they changed the layout of the page and where this element is located, its Classname - AS3/Flex
-        className = str(soup.find(lambda tag: tag.name == "h1" 
-            and tag.has_attr("id")
-            and tag["id"] == "classProductName").string)
+        for match in minifyStartTagRegex.finditer(part):
+            for attribute, name, value in getStartTagAttributes(match.group(0)):
+                if name == "class" and value:
+                    classNames.update(value.split())
+                elif name == "id" and value:
+                    idNames.add(value)
 
-        # the string is formatted like this now: "Button  - AS3 Flex", we just want "Button"
-        className = className[:className.find(" ")].strip() # strip non breaking backspace or something stupid
+    for i in range(0, len(partList), 2):
 
-        # NOTE: uncomment if we want to make this use the full qualified classname as the pageName.
-        # get the name of the package this class belongs in
-        #packageName = str(soup.find(lambda tag: tag.name == "a"
-        #    and tag.has_attr("id")
-        #    and tag["id"] == "packageName").string).strip()
+        part = minifyStyleBlockRegex.sub(lambda match: match.group(1) + getMinifiedStyleBlock(match.group(2), classNames, idNames) + match.group(3),
+            partList[i])
+        partList[i] = minifyWhitespaceRegex.sub(getMinifiedWhitespace, minifyStartTagRegex.sub(getMinifiedStartTag, part))
 
-        # NOTE: uncomment if we want to make this use the full qualified classname as the pageName.
-        # page name is the package name + class name
-        #pageName = packageName + "." + className
-        pageName = className
+    return "".join(partList)
 
-        # here, we test to see if this is a package html page. 
-        if os.path.basename(pageLink) == "package-detail.html":
+def savePage(destinationFile, html, timings=None):
+    ''' saves a rewritten page. Normally it just gets written to the Documents folder, but with --archive
+    we compress it into a member of the docset archive instead, and asyncScrapePage sends that to the parent
+    which adds it to the archive, so the page never gets written to disk by itself.
+    @param destinationFile - the path of the page in the Documents folder
+    @param html - the rewritten page as a string
+    @param timings - if not None and --minify is set, we put the size of the page before and after minifyHtml() into
+        this dictionary, as "htmlBytes" and "minifiedBytes"'''
 
-            # note that the anchor can be either "classSummary" or "interfaceSummary", so since it can 
-            # have one or both, then we just don't provide an anchor.
-            # add tuple to the list. tuple is of the format (refname, anchor)
-            tokenList.append( ("//apple_ref/cpp/Package/{}".format(pageName), "") )
+    if minifyPages:
 
-        else:
+        htmlBytes = len(html.encode("utf-8"))
+        html = minifyHtml(html)
 
-            # normal page, find props/styles/etc
+        if timings is not None:
+            timings["htmlBytes"] = htmlBytes
+            timings["minifiedBytes"] = len(html.encode("utf-8"))
 
-            # **************************
-            # type of page (class or interface)
-            # **************************
+    if archivePages:
 
-            # adds the class or interface listing to our tokenList
-            # note: we do not try and get the class type for all pages, thats why we have the check
-            # to see if there is actually a tuple before we add it to tokenList. If its none then
-            # its a weird page that isn't a class/interface (like package.html, operators.html)
-            # so we don't add it
-            tmpTuple = getClassTypeTupleFromClassSignature(soup, pageName)
+        archiveName = archiveDocumentsFolder + "/" + os.path.relpath(destinationFile, documentsFolder).replace(os.sep, "/")
+        pendingArchiveMembers.append((archiveName, getArchiveMember(archiveName, html.encode("utf-8"), archiveMtime)))
+        return
 
-            if tmpTuple:
+    # the folders were all made by the parent before the scraping started, see makePageFolders()
+    if pageWriter:
+        # this only waits if the writer is --writeQueueSize pages behind, so we can start on the next page
+        # while this one is being written. We get back the earlier pages that failed to write, asyncScrapePage
+        # returns those to the parent along with this page
+        pendingWriteErrors.extend(pageWriter.write(destinationFile, html))
+    else:
+        writePageFile(destinationFile, html)
 
-                tokenList.append(tmpTuple)
+def writePageFile(destinationFile, html):
+    ''' writes a rewritten page to the Documents folder, from savePage() or from the PageWriter thread
+    @param destinationFile - the path of the page in the Documents folder
+    @param html - the rewritten page as a string'''
 
-            # **************************
-            # properties
-            # **************************
+    with open(destinationFile, "w", encoding="utf-8") as f:
+        f.write(html)
 
-            # get the table tag 
-            propertyTableTag = getTableTag("summaryTableProperty", soup)
+def makePageFolders(destFolder, pageLinks):
+    ''' makes every folder that the pages go in, once, before the scraping starts. Otherwise every worker
+    would have to check for the folder of every page it writes, which is slow on network storage
+    @param destFolder - the Documents folder
+    @param pageLinks - the pages that we are going to write'''
 
-            if propertyTableTag:
-                # get the tag list
-                propList = getTagListFormatOne(propertyTableTag, "a", "hideInheritedProperty")
+    for folder in sorted(set(os.path.dirname(pageLink) for pageLink in pageLinks)):
+        os.makedirs(os.path.join(destFolder, folder), exist_ok=True)
 
-                # add it to tokenlist
-                tokenList.extend(getTokenAnchorTupleListFromATags(propList, "instp", pageName))
-            
-            # **************************
-            # protected properties
-            # **************************
+class PageWriter:
+    ''' writes the pages of a worker process on a background thread, so the worker can parse the next page while
+    the last one is still being written. The queue is bounded, so if the disk can't keep up the worker waits instead
+    of keeping every page in memory. A page that fails to write is reported by the next write(), since the worker
+    already told the parent that the page was done. The thread is stopped by close() when the worker exits, and the
+    pages that failed after the last write() are saved to a json file then.'''
 
+    def __init__(self, queueSize, errorPath):
+        ''' constructor, starts the thread
+        @param queueSize - how many pages can be waiting to be written
+        @param errorPath - where close() saves the error records of the pages that failed to write, if there are any'''
 
-            # get the table tag first. This code seems to be the same as the properties one, only with different ids
-            protPropertyTableTag = getTableTag("summaryTableProtectedProperty", soup)
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.errorPath = errorPath
+        self.errorList = []
+        self.errorLock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="PageWriter", daemon=True)
+        self.thread.start()
 
-            # only continue if we actually have a table tag (and therefore properties)
-            if protPropertyTableTag:
+    def write(self, destinationFile, html):
+        ''' queues a page to be written, same arguments as writePageFile()
+        @return the error records of the pages that failed to write since the last call, see takeErrors()'''
 
-                # get as list
-                protPropList = getTagListFormatOne(protPropertyTableTag, "a", "hideInheritedProtectedProperty")
+        self.queue.put((destinationFile, html))
+        return self.takeErrors()
 
-                # add to token list
-                tokenList.extend(getTokenAnchorTupleListFromATags(protPropList, "instp", pageName))
+    def takeErrors(self):
+        ''' @return the error records of the pages that failed to write since the last call, and empties the list'''
 
+        with self.errorLock:
+            errorList = self.errorList
+            self.errorList = []
 
-            # **************************
-            # methods
-            # **************************
+        return errorList
 
-            # get table tag for protected methods
-            methodTableTag = getTableTag("summaryTableMethod", soup)
+    def run(self):
+        ''' the thread, writes pages until it gets None'''
 
-            # make sure we actually have methods
-            if methodTableTag:
+        while True:
 
-                # get as list
-                methodList = getTagListFormatTwo(methodTableTag, "a", "hideInheritedMethod")
+            item = self.queue.get()
+            if item is None:
+                return
 
-                # add to token list
-                tokenList.extend(getTokenAnchorTupleListFromATags(methodList, "clm", pageName))
-                
+            destinationFile, html = item
 
-            # **************************
-            # protected methods
-            # **************************
+            try:
+                writePageFile(destinationFile, html)
 
-            # get table tag for methods. The following code is pretty much the same as the "methods" only with different ID's and such
-            protMethodTableTag = getTableTag("summaryTableProtectedMethod", soup)
+            except Exception as e:
 
-            # make sure we actually have protected methods
-            if protMethodTableTag:
+                # the same error record that asyncScrapePage() returns
+                error = {"page": os.path.relpath(destinationFile, documentsFolder).replace(os.sep, "/"),
+                    "phase": "write",
+                    "type": type(e).__name__,
+                    "message": str(e),
+                    "traceback": traceback.format_exc()}
 
-                # get as list
-                protMethodList = getTagListFormatTwo(protMethodTableTag, "a", "hideInheritedProtectedMethod")
+                with self.errorLock:
+                    self.errorList.append(error)
 
-                # add to token list
-                tokenList.extend(getTokenAnchorTupleListFromATags(protMethodList, "clm", pageName))
+    def close(self):
+        ''' writes the pages that are still in the queue, stops the thread and saves the errors'''
 
+        self.queue.put(None)
+        self.thread.join()
 
-            # **************************
-            # events
-            # **************************
+        # the asyncScrapePage() of the last pages already returned, so these can't be sent back with a page anymore
+        errorList = pendingWriteErrors + self.takeErrors()
+        if errorList:
+            with open(self.errorPath, "w", encoding="utf-8") as f:
+                json.dump(errorList, f)
 
-            # get table tag
-            eventTableTag = getTableTag("summaryTableEvent", soup)
+def loadWriteErrors(writeErrorFolder):
+    ''' loads the error records that the PageWriters of the workers saved when they exited
+    @param writeErrorFolder - the folder that the workers saved them in
+    @return a list of error records, like the ones asyncScrapePage() returns'''
 
-            # make sure we actually have events
-            if eventTableTag:
+    errorList = []
 
-                # get as list
-                eventList = getTagListFormatTwo(eventTableTag, "a", "hideInheritedEvent")
+    for fileName in sorted(os.listdir(writeErrorFolder)):
+        with open(os.path.join(writeErrorFolder, fileName), "r", encoding="utf-8") as f:
+            errorList.extend(json.load(f))
 
-                # add to token list
-                tokenList.extend(getTokenAnchorTupleListFromATags(eventList, "Event", pageName))
+    return errorList
 
+def getArchiveMtime():
+    ''' gets the timestamp that every file in the docset archive gets, in the tar headers and the gzip headers, so
+    building the same docset twice gives the same archive. Like other reproducible builds we use SOURCE_DATE_EPOCH if
+    it is set, and 0 otherwise
+    @return the timestamp, in seconds since the epoch'''
 
-            # **************************
-            # styles
-            # **************************
+    try:
+        return max(0, int(os.environ.get("SOURCE_DATE_EPOCH", "0")))
+    except ValueError:
+        print("[WARNING]: SOURCE_DATE_EPOCH isn't a number, using 0 for the times in the archive")
+        return 0
+
+def getArchiveMember(archiveName, data, mtime=0):
+    ''' makes one file of the docset archive. The archive is a normal .tgz file, but every file in it is compressed
+    as its own gzip member (gzip lets you stick members one after another and still be one valid file), so with the
+    offset of a member we can decompress just that file, see readArchiveMember()
+    @param archiveName - the path of the file inside the archive
+    @param data - the contents of the file, as bytes
+    @param mtime - the timestamp for the tar header and the gzip header, see getArchiveMtime()
+    @return the gzip compressed tar header + data of the file, as bytes'''
 
-            # get tables tag ( three of them)
-            styleTableTag = getTableTag(["summaryTablecommonStyle", "summaryTablesparkStyle", "summaryTablemobileStyle"], soup)
+    tarInfo = tarfile.TarInfo(archiveName)
+    tarInfo.size = len(data)
+    tarInfo.mtime = mtime
+    tarInfo.mode = 0o644
 
-            # make sure we actually have styles
-            if styleTableTag:
+    # tar pads every file out to 512 bytes
+    padding = b"\0" * ((tarfile.BLOCKSIZE - len(data) % tarfile.BLOCKSIZE) % tarfile.BLOCKSIZE)
 
-                # get as list, where we exclude all elements whose class is in our list
-                # here get span tags cause classes that have styles as links inherited them and we dont want 
-                # inherited stuff
-                styleTwoList = getTagListFormatTwo(styleTableTag, "span", ["hideInheritedcommonStyle", "hideInheritedmobileStyle", "hideInheritedsparkStyle"])
+    return gzip.compress(tarInfo.tobuf(format=tarfile.GNU_FORMAT) + data + padding, compresslevel=6, mtime=mtime)
+
+class DocsetArchive:
+    ''' writes the docset archive for --archive, see getArchiveMember(). Next to it we write an index file of
+    archive path -> [offset, length] of the compressed member, so one page can be read without decompressing everything'''
+
+    def __init__(self, archivePath, mtime=0):
+        ''' constructor, creates the archive
+        @param archivePath - the path of the .tgz file
+        @param mtime - the timestamp of every file in the archive, see getArchiveMtime()'''
+
+        self.archivePath = archivePath
+        self.mtime = mtime
+        self.indexPath = getArchiveIndexPath(archivePath)
+        self.members = {}
+        self.offset = 0
+        self.f = open(archivePath, "wb")
 
-                # add to token list. note these are span tags so we need a diff method
-                # anchors are in style of "style:SomethingHere"
-                tokenList.extend(getTokenAnchorTupleListFromSpanTags(styleTwoList, "instp", pageName, "style"))
+        # the pages come back from the workers in whatever order they finish in, so they wait in here
+        # until addSpooledMembers() adds them sorted by name, see spoolMember()
+        self.spoolFile = tempfile.TemporaryFile()
+        self.spooledMembers = {}
 
-            # **************************
-            # skin parts
-            # **************************
+    def addMember(self, archiveName, member):
+        ''' adds a file that was already compressed by getArchiveMember()
+        @param archiveName - the path of the file inside the archive
+        @param member - what getArchiveMember() returned'''
 
-            # get table tag
-            skinPartTableTag = getTableTag("summaryTableSkinPart", soup)
+        self.f.write(member)
+        self.members[archiveName] = [self.offset, len(member)]
+        self.offset += len(member)
 
-            # if we have skin parts:
-            if skinPartTableTag:
+    def spoolMember(self, archiveName, member):
+        ''' keeps a file that was already compressed by getArchiveMember() to be added later by addSpooledMembers(),
+        so the files are in the same order every time no matter what order they were made in
+        @param archiveName - the path of the file inside the archive
+        @param member - what getArchiveMember() returned'''
 
-                # get as list
-                # here we only get span tags, cause the classes that have skin parts as links, have inherited the 
-                # skin parts from another class and we don't want inherited props
-                skinPartList = getTagListFormatTwo(skinPartTableTag, "span", "hideInheritedSkinPart")
+        self.spooledMembers[archiveName] = (self.spoolFile.tell(), len(member))
+        self.spoolFile.write(member)
 
-                # add to list
-                # anchor is in style of "SkinPart:SomethingHere"
-                tokenList.extend(getTokenAnchorTupleListFromSpanTags(skinPartList, "instp", pageName, "SkinPart"))
+    def addSpooledMembers(self):
+        ''' adds the files that spoolMember() kept, sorted by their path in the archive'''
 
-            # **************************
-            # skin states
-            # **************************
+        for archiveName, (offset, length) in sorted(self.spooledMembers.items()):
+            self.spoolFile.seek(offset)
+            self.addMember(archiveName, self.spoolFile.read(length))
 
-            # get table tag
-            skinStateTableTag = getTableTag("summaryTableSkinState", soup)
+        self.spoolFile.close()
+        self.spooledMembers = {}
 
-            # if we have skin states
-            if skinStateTableTag:
+    def addData(self, archiveName, data):
+        ''' adds a file
+        @param archiveName - the path of the file inside the archive
+        @param data - the contents of the file, as bytes'''
 
-                # get as list
-                # here we only get span tags cause the classes that have skin states as links have inherited the 
-                # skin states from another class and we don't want inherited stuff
-                skinStateList = getTagListFormatTwo(skinStateTableTag, "span", "hideInheritedSkinState")
+        self.addMember(archiveName, getArchiveMember(archiveName, data, self.mtime))
 
-                # add to list
-                # anchors are of the format "SkinState:SomethingHere"
-                tokenList.extend(getTokenAnchorTupleListFromSpanTags(skinStateList, "instp", pageName, "SkinState"))
+    def addFile(self, archiveName, filePath):
+        ''' adds a file from the disk
+        @param archiveName - the path of the file inside the archive
+        @param filePath - the file to add'''
 
+        with open(filePath, "rb") as f:
+            self.addData(archiveName, f.read())
 
-            # **************************
-            # effects
-            # **************************
+    def close(self):
+        ''' finishes the archive with the two empty blocks that end a tar file, and writes the index'''
 
-            # get table tag
-            effectTableTag = getTableTag("summaryTableEffect", soup)
+        self.f.write(gzip.compress(b"\0" * tarfile.BLOCKSIZE * 2, mtime=self.mtime))
+        self.f.close()
 
-            # if we have effects
-            if effectTableTag:
+        with open(self.indexPath, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "members": self.members}, f, sort_keys=True)
 
-                # get as list
-                # here we only get span tags cause the classes that have effects as links have inherited the 
-                # effect from another class and we don't want inherited stuff
-                effectList = getTagListFormatTwo(effectTableTag, "span", "hideInheritedEffect")
+    def abort(self):
+        ''' stops writing the archive and removes it, so a build that stopped half way doesn't leave an archive
+        without an index behind'''
 
-                # add to list
-                # anchors are of the format "effect:SomethingHere"
-                tokenList.extend(getTokenAnchorTupleListFromSpanTags(effectList, "instp", pageName, "effect"))
+        self.spoolFile.close()
+        self.f.close()
 
-            # **************************
-            # constants
-            # **************************
+        for path in (self.archivePath, self.indexPath):
+            if os.path.exists(path):
+                os.remove(path)
 
-            # get table tag
-            constTableTag = getTableTag("summaryTableConstant", soup)
+def getArchiveIndexPath(archivePath):
+    ''' @return the path of the index file that goes with a docset archive'''
 
-            # if we have constants:
-            if constTableTag:
+    return archivePath + ".index.json"
 
-                # get as list
-                constList = getTagListFormatOne(constTableTag, "a", "hideInheritedConstant")
+def loadArchiveIndex(archivePath):
+    ''' loads the index of a docset archive, see DocsetArchive
+    @param archivePath - the path of the .tgz file
+    @return a dictionary of archive path -> [offset, length]'''
 
-                # add to list
-                tokenList.extend(getTokenAnchorTupleListFromATags(constList, "clconst", pageName))
+    with open(getArchiveIndexPath(archivePath), "r", encoding="utf-8") as f:
+        return json.load(f)["members"]
 
-        # now that we have gotten all of the tokens, we need to modify and save the html to the 
-        # Documents folder within the docset we created
-        # this is also where we add the anchor links for the Dash TOC (anchor links that have the appleref link 
-        modifyAndSaveHtml(soup, os.path.join(documentsFolder.value, pageLink), tokenList)
+def readArchiveMember(archivePath, archiveIndex, archiveName):
+    ''' reads one file out of a docset archive, only decompressing that file
+    @param archivePath - the path of the .tgz file
+    @param archiveIndex - the index from loadArchiveIndex()
+    @param archiveName - the path of the file inside the archive
+    @return the contents of the file, as bytes'''
 
-        # reassign the tokenList to our shared list (within the shared pages dict)
-        pages[pageLink] = tokenList
-    except Exception as e:
-        print(e)
-        exc_type, exc_value, exc_traceback = sys.exc_info()
+    offset, length = archiveIndex[archiveName]
 
-        # print exception
-        traceback.print_exception(exc_type, exc_value, exc_traceback)
+    with open(archivePath, "rb") as f:
+        f.seek(offset)
+        member = gzip.decompress(f.read(length))
 
+    with tarfile.open(fileobj=io.BytesIO(member), mode="r:") as tar:
+        return tar.extractfile(tar.next()).read()
 
+def delShowHideTagsHelper(tag):
+    ''' helper method to help us determine if a <div> tag is the correct tag to delete
+    when we are getting rid of the "show/hide inherited whatever" tags.
 
-def makeDocset(args):
+    @param tag - the tag that BS4 gives us when filtering
+    @return boolean, whether we want to delete this tag or not.
+    '''
+    for tag in tag.contents:            
+        if tag.name == "a":
+            return False
+    return True
+
+def trouble(message):
+    ''' prints an error message and exits with status 1
+    @param message - the error message'''
+
+    print(message + "\n")
+    # this fails if no exception is active...
+    try:
+        printTraceback()
+    except Exception as e:
+        pass
+    sys.exit(1)
+
+
+def copyStaticFile(srcPath, destPath, linkStatic=False):
+    ''' copies one static file to the Documents folder, as cheaply as the filesystem lets us
+    @param srcPath - the file we are copying
+    @param destPath - where we are copying it too
+    @param linkStatic - if True, we hardlink the file instead of copying it, if we can'''
+
+    # remove whatever is there from a previous build first (--incremental), since it might be a hardlink
+    # to the source file and we don't want to write through it
+    if os.path.lexists(destPath):
+        os.remove(destPath)
+
+    if linkStatic:
+        try:
+            os.link(srcPath, destPath)
+            return
+        except OSError:
+            # different filesystem, or the filesystem doesn't do hardlinks, so just copy it
+            pass
+
+    # copy_file_range lets the kernel copy the file (or reflink it, on filesystems that support it)
+    # without the data coming through python. shutil.copyfile already uses sendfile() on linux, so thats
+    # the fallback
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(srcPath, "rb") as src, open(destPath, "wb") as dest:
+                while os.copy_file_range(src.fileno(), dest.fileno(), 1 << 30) > 0:
+                    pass
+            shutil.copystat(srcPath, destPath)
+            return
+        except OSError:
+            pass
+
+    shutil.copy2(srcPath, destPath)
+
+def getModifiedCss(srcPath, entry):
+    ''' reads one of the css files that we need to modify and modifies it
+    @param srcPath - the css file
+    @param entry - the name of the css file, in modifiedCssFiles
+    @return the modified css as a string'''
+
+    # here we change the css top property to be smaller so we dont have a big gap at the top
+    tmpCss = None
+    with open(srcPath, "r", encoding="utf-8") as f:
+        tmpCss = f.read()
+
+    if entry == "filter-style.css":
+        # change the top property, as suggested by Kapeli
+        tmpCss = re.sub("top:.*?;", "top:0px", tmpCss)
+    elif entry == "style.css":
+
+        # get rid of the header, as suggested by Kapeli
+        tmpCss = re.sub(".titleTable{.*}",".titleTable{width:100%; display:none}", tmpCss)
+
+        # remove overflow:hidden so the pages scroll properly in dash
+        tmpCss = re.sub("overflow:hidden;?", "", tmpCss)
+
+    return tmpCss
+
+def copyAndModifyCss(srcPath, destPath, entry):
+    ''' copies one of the css files that we need to modify to the Documents folder
+    @param srcPath - the css file we are copying
+    @param destPath - where we are copying it too
+    @param entry - the name of the css file, in modifiedCssFiles'''
+
+    tmpCss = getModifiedCss(srcPath, entry)
+
+    # write modified file to dest directory, removing it first in case its a hardlink from a --linkStatic build
+    if os.path.lexists(destPath):
+        os.remove(destPath)
+
+    with open(destPath, "w", encoding="utf-8") as f:
+        f.write(tmpCss)
+
+class AssetStore:
+    ''' a content addressed store of the static files (css, images, etc), see --assetStore. Most of them are
+    the same in every version of the documentation, so when the docsets for several versions use the same store,
+    every different file is stored once under objects/ by its hash and hardlinked into each docset. The files in the
+    store are made read only, so changing one in a docset doesn't change it in all of them.
+    copyAndModifyStaticFilesToDocs() uses this from several threads at once, and more than one build can use the
+    same store at the same time, since new files are moved into place in one step.'''
+
+    def __init__(self, storeFolder):
+        ''' constructor
+        @param storeFolder - the folder of the store, gets created if it doesn't exist'''
+
+        self.storeFolder = storeFolder
+        self.objectsFolder = os.path.join(storeFolder, "objects")
+        self.lock = threading.Lock()
+
+        # for the summary at the end of the build
+        self.newFiles = 0
+        self.newBytes = 0
+        self.reusedFiles = 0
+        self.reusedBytes = 0
+        self.copiedFiles = 0
+
+        os.makedirs(self.objectsFolder, exist_ok=True)
+
+    def addData(self, data):
+        ''' adds a file to the store, unless its already there
+        @param data - the contents of the file, as bytes
+        @return the path of the file in the store'''
+
+        digest = hashlib.sha1(data).hexdigest()
+        objectFolder = os.path.join(self.objectsFolder, digest[:2])
+        objectPath = os.path.join(objectFolder, digest[2:])
+
+        if os.path.exists(objectPath):
+
+            with self.lock:
+                self.reusedFiles += 1
+                self.reusedBytes += len(data)
+
+            return objectPath
+
+        os.makedirs(objectFolder, exist_ok=True)
+
+        # write it next to where it goes and then move it there, so another thread or build never sees half of it
+        fd, tempPath = tempfile.mkstemp(dir=objectFolder, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+
+            os.chmod(tempPath, 0o444)
+            os.replace(tempPath, objectPath)
+
+        except BaseException:
+            os.remove(tempPath)
+            raise
+
+        with self.lock:
+            self.newFiles += 1
+            self.newBytes += len(data)
+
+        return objectPath
+
+    def linkData(self, data, destPath):
+        ''' puts a file in the docset, hardlinked to the copy in the store
+        @param data - the contents of the file, as bytes
+        @param destPath - where the file goes in the Documents folder'''
+
+        objectPath = self.addData(data)
+
+        # remove whatever is there from a previous build first (--incremental)
+        if os.path.lexists(destPath):
+            os.remove(destPath)
+
+        try:
+            os.link(objectPath, destPath)
+        except OSError:
+            # the docset is on a different filesystem than the store, so it gets its own copy
+            shutil.copyfile(objectPath, destPath)
+
+            with self.lock:
+                self.copiedFiles += 1
+
+    def linkFile(self, srcPath, destPath):
+        ''' puts a file from the documentation in the docset, hardlinked to the copy in the store. This has the same
+        arguments as shutil.copy2, so it can be the copy_function for shutil.copytree
+        @param srcPath - the file we are copying
+        @param destPath - where we are copying it too
+        @return destPath'''
+
+        with open(srcPath, "rb") as f:
+            self.linkData(f.read(), destPath)
+
+        return destPath
+
+    def printSummary(self):
+        ''' prints how much of the static files were already in the store'''
+
+        print("Asset store {}: {} new file(s) ({:,} bytes) added, {} file(s) ({:,} bytes) were already there".format(self.storeFolder,
+            self.newFiles, self.newBytes, self.reusedFiles, self.reusedBytes))
+
+        if self.copiedFiles:
+            print("[WARNING]: {} file(s) had to be copied instead of hardlinked, the docset and the asset store are on different filesystems".format(
+                self.copiedFiles))
+
+def linkModifiedCss(srcPath, destPath, entry, assetStore):
+    ''' the --assetStore version of copyAndModifyCss(), the modified css goes in the store too, since its
+    the same for every docset that has the same original css
+    @param srcPath - the css file we are copying
+    @param destPath - where we are copying it too
+    @param entry - the name of the css file, in modifiedCssFiles
+    @param assetStore - the AssetStore'''
+
+    assetStore.linkData(getModifiedCss(srcPath, entry).encode("utf-8"), destPath)
+
+def copyAndModifyStaticFilesToDocs(srcFolder, destFolder, executor, linkStatic=False, skipFiles=(), assetStore=None):
+    ''' copies static files to the Documents folder, that don't get
+    copied automatically during our script run. Css files, html files,etc.
+    For a few CSS files that we need to modify, we modify them here.
+    The copying is done on a thread pool, so it happens at the same time as the page scraping,
+    call result() on every future that we return to wait for it to finish.
+
+    @param srcFolder - folder that we are copying stuff from
+    @param destFolder - the folder we are copying stuff too
+    @param executor - the concurrent.futures.ThreadPoolExecutor that does the copying
+    @param linkStatic - if True, hardlink the files instead of copying them, when they are on the same filesystem
+    @param skipFiles - files that we should not copy since the scraping writes them
+    @param assetStore - if not None, the AssetStore that the files get hardlinked from, see --assetStore
+    @return a list of concurrent.futures.Future objects, one for each thing we are copying'''
+
+    futureList = []
+
+    # copy all of the index files from our htmlPagesToParse list at the top 
+    # of the script, and the static files
+    for entry in htmlPagesToParse + staticFiles:
+
+        if entry in skipFiles:
+            continue
+
+        srcPath = os.path.join(srcFolder, entry)
+        destPath = os.path.join(destFolder, entry)
+
+        # have special cases for some css files
+        if entry in modifiedCssFiles and assetStore:
+            futureList.append(executor.submit(linkModifiedCss, srcPath, destPath, entry, assetStore))
+        elif entry in modifiedCssFiles:
+            futureList.append(executor.submit(copyAndModifyCss, srcPath, destPath, entry))
+        elif assetStore:
+            futureList.append(executor.submit(assetStore.linkFile, srcPath, destPath))
+        else:
+            # normal file, just copy it to dest directory
+            futureList.append(executor.submit(copyStaticFile, srcPath, destPath, linkStatic))
+
+    # copy static folders
+    copyFunction = assetStore.linkFile if assetStore else functools.partial(copyStaticFile, linkStatic=linkStatic)
+
+    for entry in staticFolders:
+
+        # dirs_exist_ok so this works when we are updating an existing docset with --incremental
+        futureList.append(executor.submit(shutil.copytree, os.path.join(srcFolder, entry), os.path.join(destFolder, entry),
+            copy_function=copyFunction, dirs_exist_ok=True))
+
+    return futureList
+
+
+def addStaticFilesToArchive(srcFolder, archive, skipFiles=()):
+    ''' the --archive version of copyAndModifyStaticFilesToDocs(), adds the static files to the docset archive
+    @param srcFolder - folder that we are copying stuff from
+    @param archive - the DocsetArchive
+    @param skipFiles - files that we should not add since the scraping adds them'''
+
+    for entry in htmlPagesToParse + staticFiles:
+
+        if entry in skipFiles:
+            continue
+
+        if entry in modifiedCssFiles:
+            archive.addData(archiveDocumentsFolder + "/" + entry, getModifiedCss(os.path.join(srcFolder, entry), entry).encode("utf-8"))
+        else:
+            archive.addFile(archiveDocumentsFolder + "/" + entry, os.path.join(srcFolder, entry))
+
+    for entry in staticFolders:
+        for root, dirs, files in os.walk(os.path.join(srcFolder, entry)):
+
+            dirs.sort()
+            for fileName in sorted(files):
+                filePath = os.path.join(root, fileName)
+                archive.addFile(archiveDocumentsFolder + "/" + os.path.relpath(filePath, srcFolder).replace(os.sep, "/"), filePath)
+
+def getFileHash(filePath):
+    ''' gets the hash of a file's contents, used to tell if a page changed since the last build
+    @param filePath - the path to the file
+    @return the sha1 hex digest of the file as a string'''
+
+    with open(filePath, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def loadManifest(manifestPath):
+    ''' loads the manifest that was written by the last build, see saveManifest()
+    @param manifestPath - the path to the manifest json file
+    @return a dictionary of pageLink -> (hash, compact token list), its empty if there is no manifest or
+        if it was written by a different manifestVersion'''
+
+    if not os.path.exists(manifestPath):
+        return {}
+
+    with open(manifestPath, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != manifestVersion:
+        print("the manifest at {} is from a different version of this script, ignoring it".format(manifestPath))
+        return {}
+
+    # json turns our tuples into lists, turn them back
+    return {pageLink: (entry["hash"], packTokenList([tuple(x) for x in entry["tokens"]])) for pageLink, entry in manifest["pages"].items()}
+
+def loadPageList(pageListPath):
+    ''' loads a list of pages, one per line, like the failed pages list that makeDocset() writes
+    @param pageListPath - the path to the file
+    @return a list of the normalized page links in the file'''
+
+    with open(pageListPath, "r", encoding="utf-8") as f:
+        return [normalizePageLink(line.strip()) for line in f if line.strip()]
+
+def savePageList(pageListPath, pageLinks):
+    ''' saves a list of pages, one per line, see loadPageList()
+    @param pageListPath - the path to the file
+    @param pageLinks - the page links to save'''
+
+    with open(pageListPath, "w", encoding="utf-8") as f:
+        for pageLink in sorted(pageLinks):
+            f.write(pageLink + "\n")
+
+def saveManifest(manifestPath, pages, pageHashes, failedPages=()):
+    ''' saves the manifest of source path -> content hash -> tokens, so the next build with
+    --incremental knows what pages it can skip
+    @param manifestPath - the path to the manifest json file
+    @param pages - the pages dictionary, pageLink -> the compact token list from packTokenList()
+    @param pageHashes - dictionary of pageLink -> hash of the source html file
+    @param failedPages - pages that we couldn't scrape, these are left out so the next build tries them again'''
+
+    # the tokens are written in the (appleRef, anchor) form so the manifest is readable. We write it one page at a time
+    # so we never have all the unpacked token lists in memory at once
+    with open(manifestPath, "w", encoding="utf-8") as f:
+
+        f.write('{{"version": {}, "pages": {{'.format(manifestVersion))
+
+        separator = ""
+        for pageLink, tokenList in pages.items():
+
+            if pageLink in failedPages:
+                continue
+
+            f.write("{}{}: {}".format(separator, json.dumps(pageLink),
+                json.dumps({"hash": pageHashes[pageLink], "tokens": unpackTokenList(tokenList)})))
+            separator = ", "
+
+        f.write("}}")
+
+def writeMinifyReport(reportPath, minifySizes, topN):
+    ''' writes the json report of how many bytes --minify saved on every page, and prints the total and the
+    pages that it saved the most on
+    @param reportPath - where we write the json report to
+    @param minifySizes - a list of (pageLink, bytes before, bytes after) tuples, one for every page
+    @param topN - how many of the pages to print'''
+
+    htmlBytes = sum(x[1] for x in minifySizes)
+    minifiedBytes = sum(x[2] for x in minifySizes)
+
+    with open(reportPath, "w", encoding="utf-8") as f:
+        json.dump({"htmlBytes": htmlBytes, "minifiedBytes": minifiedBytes,
+            "pages": [{"page": pageLink, "htmlBytes": before, "minifiedBytes": after} for pageLink, before, after in sorted(minifySizes)]}, f, indent=1)
+
+    print("Minified {} page(s) from {:,} bytes to {:,} bytes, saved {:,} bytes ({:.1f}%)".format(len(minifySizes), htmlBytes,
+        minifiedBytes, htmlBytes - minifiedBytes, 100.0 * (htmlBytes - minifiedBytes) / htmlBytes if htmlBytes else 0.0))
+
+    for pageLink, before, after in sorted(minifySizes, key=lambda x: x[1] - x[2], reverse=True)[:topN]:
+        print("    {:>10} -> {:>10} bytes ({:5.1f}%)  {}".format(before, after, 100.0 * (before - after) / before if before else 0.0, pageLink))
+
+    print("The minify report for every page is in {}".format(reportPath))
+
+
+# the summary tables on a class page that we get tokens from with the lxml-native parser. Its the same
+# tables (in the same order) that asyncScrapePage goes through with bs4, each entry is:
+# (table id(s), format one or two (see getTagListFormatOne/Two), tag name, hidden id(s), reftype, anchor prefix for <span> tags)
+lxmlSummaryTables = [("summaryTableProperty", 1, "a", "hideInheritedProperty", "instp", None),
+    ("summaryTableProtectedProperty", 1, "a", "hideInheritedProtectedProperty", "instp", None),
+    ("summaryTableMethod", 2, "a", "hideInheritedMethod", "clm", None),
+    ("summaryTableProtectedMethod", 2, "a", "hideInheritedProtectedMethod", "clm", None),
+    ("summaryTableEvent", 2, "a", "hideInheritedEvent", "Event", None),
+    (["summaryTablecommonStyle", "summaryTablesparkStyle", "summaryTablemobileStyle"], 2, "span",
+        ["hideInheritedcommonStyle", "hideInheritedmobileStyle", "hideInheritedsparkStyle"], "instp", "style"),
+    ("summaryTableSkinPart", 2, "span", "hideInheritedSkinPart", "instp", "SkinPart"),
+    ("summaryTableSkinState", 2, "span", "hideInheritedSkinState", "instp", "SkinState"),
+    ("summaryTableEffect", 2, "span", "hideInheritedEffect", "instp", "effect"),
+    ("summaryTableConstant", 1, "a", "hideInheritedConstant", "clconst", None)]
+
+# the pages are utf-8, lxml would guess latin-1 if we didn't tell it
+lxmlUtf8Parser = lxml.html.HTMLParser(encoding="utf-8")
+
+# precompiled xpath expressions for the lxml-native parser. hasClass() matches one of the values in the class attribute
+def hasClass(className):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(className)
+
+lxmlFindParentClassedLinks = etree.XPath("//a[../@class]")
+lxmlFindProductName = etree.XPath("//h1[@id = 'classProductName']")
+lxmlFindClassSignature = etree.XPath("//td[{}]".format(hasClass("classSignature")))
+lxmlFindTablesWithId = etree.XPath("//table[@id]")
+lxmlFindSignatureLinks = etree.XPath(".//*[name() = $tagName][{}]".format(hasClass("signatureLink")))
+lxmlFindFilterPanel = etree.XPath("//div[@id = 'filter_panel_float']")
+lxmlFindMainContainer = etree.XPath("//div[@id = 'maincontainer'][@style]")
+lxmlFindSearchForm = etree.XPath("//form[{}]".format(hasClass("searchFormION")))
+lxmlFindClassedRows = etree.XPath("//tr[@class] | //table[@class]")
+lxmlFindShowHideLinks = etree.XPath("//div[{}]".format(hasClass("showHideLinks")))
+lxmlFindNamedAnchors = etree.XPath("//a[@name]")
+lxmlFindDisplayNone = etree.XPath("//div[contains(@style, 'style:none')]")
+lxmlFindContentDiv = etree.XPath("//div[{}]".format(hasClass("content")))
+lxmlFindTableById = etree.XPath(".//table[@id = $tableId]")
+lxmlFindPackageLinks = etree.XPath(".//td[{}]/a".format(hasClass("summaryTableSecondCol")))
+lxmlFindPackageInterfaceLinks = etree.XPath(".//td[{}]/i/a".format(hasClass("summaryTableSecondCol")))
+
+def getLxmlClasses(element):
+    ''' gets the values of the class attribute of a lxml element, like bs4's tag["class"] does
+    @param element - the lxml element
+    @return a list of strings'''
+
+    return element.get("class", "").split()
+
+def getLxmlString(element):
+    ''' the same thing as bs4's tag.string for a lxml element, if the element only has one child
+    we get the text of it, if it has none or more then one then its None
+
+    @param element - the lxml element
+    @return the string or None'''
+
+    children = []
+    if element.text:
+        children.append(element.text)
+    for child in element:
+        children.append(child)
+        if child.tail:
+            children.append(child.tail)
+
+    if len(children) != 1:
+        return None
+
+    if isinstance(children[0], str):
+        return children[0]
+
+    if not isinstance(children[0].tag, str):
+        # comments and processing instructions, bs4 treats these as strings too
+        return children[0].text
+
+    return getLxmlString(children[0])
+
+def getLxmlPreviousSibling(element):
+    ''' the same thing as bs4's tag.previous_sibling for a lxml element, which can be a string
+    since lxml keeps the text between elements in the .tail of the element before it
+
+    @param element - the lxml element
+    @return a string, a lxml element or None'''
+
+    previous = element.getprevious()
+
+    if previous is not None:
+        return previous.tail if previous.tail else previous
+
+    parent = element.getparent()
+
+    return parent.text if parent is not None and parent.text else None
+
+def lxmlGetPageLinksFromIndex(tree):
+    ''' the lxml-native version of getPageLinksFromIndex()
+    @param tree - the lxml ElementTree of the all-index-LETTER.html file
+    @return a list of the normalized page links, with duplicates'''
+
+    # same as isPagesLink(), the first class of the parent has to be idxrow
+    return [normalizePageLink(el.attrib["href"]) for el in lxmlFindParentClassedLinks(tree)
+        if getLxmlClasses(el.getparent())[:1] == ["idxrow"]]
+
+def lxmlGetTagList(tableElement, tableFormat, tagToSearchFor, hiddenId):
+    ''' the lxml-native version of getTagListFormatOne() and getTagListFormatTwo(), with the exact
+    same rules for what tags we want so we get the same tokens
+
+    @param tableElement - the <table> element that we are searching
+    @param tableFormat - 1 or 2, see getTagListFormatOne() and getTagListFormatTwo()
+    @param tagToSearchFor - the tag's name to search for as a string
+    @param hiddenId - the class of the <tr> tags that are hidden (as in inherited), can be a string or a list
+    @return a list of lxml elements'''
+
+    tmpList = []
+
+    for el in lxmlFindSignatureLinks(tableElement, tagName=tagToSearchFor):
+
+        parent = el.getparent()
+        grandparent = parent.getparent() if parent is not None else None
+
+        if tableFormat == 1:
+
+            if (parent is not None
+                and parent.tag == "td"
+                and "summaryTableSignatureCol" in getLxmlClasses(parent)
+                and grandparent is not None
+                and "class" in grandparent.attrib
+                and hiddenId not in getLxmlClasses(grandparent)):
+
+                tmpList.append(el)
+
+        else:
+
+            row = grandparent.getparent() if grandparent is not None else None
+
+            if (parent is not None
+                and "summarySignature" in getLxmlClasses(parent)
+                and grandparent is not None
+                and row is not None
+                and row.tag == "tr"
+                and "class" in row.attrib):
+
+                # same as the bs4 version, the list version checks the <td> and the string version checks the <tr>
+                if isinstance(hiddenId, list):
+                    if [x not in grandparent.attrib["class"].split() for x in hiddenId]:
+                        tmpList.append(el)
+                elif hiddenId not in getLxmlClasses(row):
+                    tmpList.append(el)
+
+    return tmpList
+
+def lxmlGetTokenList(tree, pageLink):
+    ''' the lxml-native version of the scraping that asyncScrapePage does with bs4
+
+    @param tree - the lxml ElementTree of the page
+    @param pageLink - the page's path relative to the documentation folder
+    @return the list of (appleRef, anchor) tuples for the page'''
+
+    tokenList = []
+
+    # see asyncScrapePage for why we do this
+    className = str(getLxmlString(lxmlFindProductName(tree)[0]))
+    className = className[:className.find(" ")].strip()
+    pageName = className
+
+    if os.path.basename(pageLink) == "package-detail.html":
+
+        tokenList.append( ("//apple_ref/cpp/Package/{}".format(pageName), "") )
+        return tokenList
+
+    # type of page (class or interface), see getClassTypeTupleFromClassSignature()
+    signatureList = lxmlFindClassSignature(tree)
+    previous = getLxmlPreviousSibling(signatureList[0]) if signatureList else None
+
+    if previous is not None:
+        classType = str(previous if isinstance(previous, str) else getLxmlString(previous)).lower()
+        tokenList.append(getClassTypeTuple(classType, pageName))
+
+    tableList = lxmlFindTablesWithId(tree)
+
+    for tableId, tableFormat, tagToSearchFor, hiddenId, refType, anchorPrefix in lxmlSummaryTables:
+
+        # the first table with the id, same as getTableTag()
+        tableElement = next((el for el in tableList if el.get("id") in tableId), None)
+
+        if tableElement is None:
+            continue
+
+        for el in lxmlGetTagList(tableElement, tableFormat, tagToSearchFor, hiddenId):
+
+            if anchorPrefix is None:
+                tokenList.append((getTokenString(refType, pageName, str(getLxmlString(el))), el.attrib["href"].lstrip("#")))
+            else:
+                tokenList.append((getTokenString(refType, pageName, str(getLxmlString(el))), "{}:{}".format(anchorPrefix, str(getLxmlString(el)))))
+
+    return tokenList
+
+def lxmlInsertAnchorAfter(element, appleRef):
+    ''' inserts a <a name="appleRef"> element right after element, like bs4's insert_after
+    @param element - the lxml element
+    @param appleRef - the value of the name attribute'''
+
+    newElement = lxml.html.Element("a")
+    newElement.set("name", appleRef)
+
+    # lxml keeps the text after an element as part of the element, move it so the new element goes right after the tag
+    newElement.tail = element.tail
+    element.tail = None
+    element.addnext(newElement)
+
+def lxmlModifyAndSaveHtml(tree, destinationFile, tokenList, timings=None):
+    ''' the lxml-native version of modifyAndSaveHtml(), see that for what and why we are changing things
+
+    @param tree - the lxml ElementTree of the page
+    @param destinationFile - where we are saving the modified html
+    @param tokenList - the list of (appleRef, anchor) tuples for the current page
+    @param timings - same as modifyAndSaveHtml()
+    @return a list of warnings, same as modifyAndSaveHtml()'''
+
+    warningList = []
+
+    # drop_tree() keeps the text after the element, like bs4's decompose()
+    for el in lxmlFindFilterPanel(tree)[:1]:
+        el.drop_tree()
+
+    # NOTE: the bs4 version compares the class list against a string for the "splitter" and "mainleft"
+    # divs so those never get removed, we leave them alone here too so both parsers give the same page
+
+    for el in lxmlFindMainContainer(tree)[:1]:
+        del el.attrib["style"]
+
+    for el in lxmlFindSearchForm(tree)[:1]:
+        el.drop_tree()
+
+    for el in lxmlFindClassedRows(tree):
+        classNameList = getLxmlClasses(el)
+        if classNameList:
+            el.set("class", " ".join(x for x in classNameList if not x.startswith("hide")))
+
+    for el in lxmlFindShowHideLinks(tree):
+        if not any(child.tag == "a" for child in el):
+            el.drop_tree()
+
+    # name -> first <a> element with that name
+    anchorTags = {}
+    for el in lxmlFindNamedAnchors(tree):
+        anchorTags.setdefault(el.get("name"), el)
+
+    for appleRef, anchorLink in tokenList:
+
+        if anchorLink != "":
+
+            anchorTag = anchorTags.get(anchorLink)
+
+            if anchorTag is None:
+                warningList.append({"page": destinationFile,
+                    "token": appleRef,
+                    "anchor": anchorLink,
+                    "message": "could not find the <a name=\"{}\"> anchor for the token {}".format(anchorLink, appleRef)})
+                continue
+
+            lxmlInsertAnchorAfter(anchorTag, appleRef)
+
+    for el in lxmlFindDisplayNone(tree):
+        el.drop_tree()
+
+    if os.path.basename(destinationFile) == "package-detail.html":
+
+        contentList = lxmlFindContentDiv(tree)
+
+        for tableId, tokenType in [("summaryTableIdConstant", "clconst"), ("summaryTableIdClass", "cl"),
+            ("summaryTableIdFunction", "func"), ("summaryTableIdInterface", "Interface")]:
+
+            tableList = lxmlFindTableById(contentList[0], tableId=tableId) if contentList else []
+
+            if tableList:
+
+                # interfaces are in italic, see addApplerefToPackageDetailPage()
+                finder = lxmlFindPackageInterfaceLinks if tokenType == "Interface" else lxmlFindPackageLinks
+
+                for el in finder(tableList[0]):
+                    lxmlInsertAnchorAfter(el, "//apple_ref/cpp/{}/{}".format(tokenType, str(getLxmlString(el))))
+
+    serializeStartTime = time.perf_counter()
+
+    html = lxml.html.tostring(tree, encoding="unicode", doctype=tree.docinfo.doctype)
+
+    writeStartTime = time.perf_counter()
+
+    savePage(destinationFile, html, timings)
+
+    if timings is not None:
+        timings["serialize"] = writeStartTime - serializeStartTime
+        timings["write"] = time.perf_counter() - writeStartTime
+
+    return warningList
+
+def packTokenList(tokenList):
+    ''' turns a list of (appleRef, anchor) tuples for one page into the compact form that the workers send
+    back to the parent and that the pages dictionary holds. Every token on a page is //apple_ref/cpp/TYPE/pageName
+    or //apple_ref/cpp/TYPE/pageName.member, and the anchor is usually the member, so instead of pickling those
+    strings over and over we store the page name once, the types as one byte each, and only the parts that are different.
+
+    The compact form is a tuple of (pageName, typeCodes, memberNames, anchors):
+        typeCodes - bytes, the index of each token's type in tokenTypes
+        memberNames - tuple, None if the token's name is just the page name, otherwise what comes after "pageName."
+        anchors - tuple, None if the anchor is the same as the member name (or "" when the member name is None)
+    Tokens that don't fit this get the rawTokenCode, and the whole apple ref goes in memberNames.
+
+    @param tokenList - the list of (appleRef, anchor) tuples
+    @return the compact form, or None if the list is empty'''
+
+    if not tokenList:
+        return None
+
+    prefix = "//apple_ref/cpp/"
+
+    # the first token is the class/interface/package if there is one, its name is the page name. If there isn't one, the
+    # page name is before the first dot of the first member. If we guess wrong, the tokens just get stored as raw
+    refType, name = tokenList[0][0][len(prefix):].partition("/")[::2]
+    pageName = name if refType in ("cl", "Interface", "Package") else name.split(".")[0]
+    memberPrefix = pageName + "."
+
+    typeCodes = bytearray()
+    memberNames = []
+    anchors = []
+
+    for appleRef, anchor in tokenList:
+
+        refType, name = appleRef[len(prefix):].partition("/")[::2]
+
+        if not appleRef.startswith(prefix) or refType not in tokenTypeCodes:
+            memberName = None
+            code = rawTokenCode
+        elif name == pageName:
+            memberName = None
+            code = tokenTypeCodes[refType]
+        elif name.startswith(memberPrefix):
+            memberName = name[len(memberPrefix):]
+            code = tokenTypeCodes[refType]
+        else:
+            code = rawTokenCode
+
+        if code == rawTokenCode:
+            typeCodes.append(code)
+            memberNames.append(appleRef)
+            anchors.append(anchor)
+            continue
+
+        typeCodes.append(code)
+        memberNames.append(memberName)
+        anchors.append(None if anchor == (memberName or "") else anchor)
+
+    return (pageName, bytes(typeCodes), tuple(memberNames), tuple(anchors))
+
+def unpackTokenList(packedTokens):
+    ''' turns the compact form from packTokenList() back into the list of (appleRef, anchor) tuples, we only do this
+    when we write the tokens out
+    @param packedTokens - the compact form, or None
+    @return the list of (appleRef, anchor) tuples'''
+
+    if packedTokens is None:
+        return []
+
+    pageName, typeCodes, memberNames, anchors = packedTokens
+    tokenList = []
+
+    for code, memberName, anchor in zip(typeCodes, memberNames, anchors):
+
+        if code == rawTokenCode:
+            tokenList.append((memberName, anchor))
+            continue
+
+        name = pageName if memberName is None else pageName + "." + memberName
+        tokenList.append(("//apple_ref/cpp/" + tokenTypes[code] + "/" + name, (memberName or "") if anchor is None else anchor))
+
+    return tokenList
+
+def getTokenCount(packedTokens):
+    ''' @return how many tokens are in the compact form from packTokenList(), which can be None'''
+
+    return len(packedTokens[1]) if packedTokens is not None else 0
+
+def writeTokensXml(tokensXmlPath, pages):
+    ''' writes the Tokens.xml file. The format of this file is
+    <Tokens>
+      <File>
+          <Token>
+              <TokenIdentifier>
+              <Anchor>
+      ... more <File> tags
+
+    we write every <File> tag to the file as we go instead of building the whole xml document in memory first,
+    and the pages are sorted by their path so we get the exact same file every time for the same documentation.
+
+    @param tokensXmlPath - the path of the Tokens.xml file we are writing
+    @param pages - the pages dictionary, pageLink -> the compact token list from packTokenList()'''
+
+    with open(tokensXmlPath, "w", encoding="utf-8") as f:
+
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<Tokens version="1.0">\n')
+
+        for pageHref in sorted(pages.keys()):
+
+            tokenList = unpackTokenList(pages[pageHref])
+
+            # we only write <File> tags if there are actually any tokens to write.
+            if len(tokenList) == 0:
+                continue
+
+            f.write("<File path={}>\n".format(quoteattr(pageHref)))
+
+            for appleRef, anchor in tokenList:
+
+                if anchor != "": # don't add an anchor for empty strings as anchors, they don't have one!
+                    f.write("\t<Token><TokenIdentifier>{}</TokenIdentifier><Anchor>{}</Anchor></Token>\n".format(escape(appleRef), escape(anchor)))
+                else:
+                    f.write("\t<Token><TokenIdentifier>{}</TokenIdentifier></Token>\n".format(escape(appleRef)))
+
+            f.write("</File>\n")
+
+        f.write("</Tokens>\n")
+
+def writeSqliteIndex(indexPath, pages):
+    ''' creates the docSet.dsidx sqlite search index that dash uses, straight from the pages dictionary,
+    so we don't need apple's docsetutil (which only exists on OSX with Xcode installed)
+
+    the table is searchIndex(id, name, type, path), where path is the page plus the anchor if the token has one
+
+    @param indexPath - the path of the docSet.dsidx file we are creating, it gets replaced if it already exists
+    @param pages - the pages dictionary, pageLink -> the compact token list from packTokenList()'''
+
+    if os.path.exists(indexPath):
+        os.remove(indexPath)
+
+    def getRows():
+        ''' generator of the (name, type, path) rows for the searchIndex table, without any duplicates
+        since the unique index would fail on those'''
+
+        seenRows = set()
+
+        for pageHref in sorted(pages.keys()):
+            for appleRef, anchor in unpackTokenList(pages[pageHref]):
+
+                # the token strings look like //apple_ref/cpp/TYPE/name, and name can have slashes in it
+                refType, name = appleRef.split("/", 5)[4:]
+
+                row = (name, dashEntryTypes.get(refType, refType), pageHref + "#" + anchor if anchor != "" else pageHref)
+
+                if row not in seenRows:
+                    seenRows.add(row)
+                    yield row
+
+    connection = sqlite3.connect(indexPath)
+
+    try:
+        connection.execute("CREATE TABLE searchIndex(id INTEGER PRIMARY KEY, name TEXT, type TEXT, path TEXT)")
+
+        # insert everything in one transaction, and only create the index after, its a lot faster
+        # then updating the index for every row
+        with connection:
+            connection.executemany("INSERT INTO searchIndex(name, type, path) VALUES (?, ?, ?)", getRows())
+
+        connection.execute("CREATE UNIQUE INDEX anchor ON searchIndex (name, type, path)")
+        connection.commit()
+
+    finally:
+        connection.close()
+
+class ProgressReporter:
+    ''' keeps track of how many pages the worker processes have finished and prints a progress
+    line every so often. Only the parent process uses this, the workers just tell us their pid
+    along with every page they return, so there is no shared counter or lock between processes.'''
+
+    def __init__(self, total, interval, quiet):
+        ''' constructor
+        @param total - the total number of pages we are going to parse
+        @param interval - print a progress line at most once every this many seconds
+        @param quiet - if True, don't print anything'''
+
+        self.total = total
+        self.interval = interval
+        self.quiet = quiet
+        self.done = 0
+        self.workerCounts = {} # pid -> number of pages that worker has finished
+        self.startTime = time.perf_counter()
+        self.lastPrintTime = self.startTime
+
+    def pageDone(self, pid):
+        ''' called every time a worker finishes a page, prints the progress line if enough
+        time has gone by since the last time we printed it.
+        @param pid - the pid of the worker process that finished the page'''
+
+        self.done += 1
+        self.workerCounts[pid] = self.workerCounts.get(pid, 0) + 1
+
+        now = time.perf_counter()
+        if now - self.lastPrintTime >= self.interval or self.done == self.total:
+            self.lastPrintTime = now
+            self.printProgress(now)
+
+    def printProgress(self, now):
+        ''' prints a line with the number of pages done, pages per second, the ETA and how many pages
+        each worker has done
+        @param now - the current time.perf_counter() value'''
+
+        if self.quiet:
+            return
+
+        elapsed = now - self.startTime
+        pagesPerSecond = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / pagesPerSecond if pagesPerSecond > 0 else 0.0
+
+        workerString = ", ".join("{}: {}".format(pid, count) for pid, count in sorted(self.workerCounts.items()))
+
+        print("Parsed {}/{} pages ({:.1f}%), {:.1f} pages/sec, ETA {:.0f}s, pages per worker PID: [{}]".format(self.done,
+            self.total, 100.0 * self.done / self.total, pagesPerSecond, eta, workerString))
+
+        # make sure it shows up right away even if stdout is a pipe
+        sys.stdout.flush()
+
+def getPeakRssMb(who=None):
+    ''' gets the peak resident memory of this process (or of the child processes we have waited for)
+    @param who - resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN, defaults to RUSAGE_SELF
+    @return the peak memory in megabytes, or None if the resource module isn't available'''
+
+    if resource is None:
+        return None
+
+    maxRss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+
+    # its in bytes on OSX and in kilobytes everywhere else
+    return maxRss / (1024 * 1024) if sys.platform == "darwin" else maxRss / 1024
+
+class BuildProfiler:
+    ''' records how long each phase of makeDocset() takes (wall time, cpu time and peak memory) and the
+    per page timings that the workers send back, for the --profile report. Only the parent process uses this.
+    If its not enabled, none of the methods do anything.'''
+
+    def __init__(self, enabled):
+        ''' constructor
+        @param enabled - if False, we don't record anything'''
+
+        self.enabled = enabled
+        self.phases = [] # list of dictionaries, one per phase, in the order they happened
+        self.pages = [] # list of the timing dictionaries the workers returned
+        self.workerFinishTimes = {} # pid -> when we got the last page from that worker
+        self.currentPhase = None
+        self.startTime = time.perf_counter()
+
+    def startPhase(self, name):
+        ''' ends the current phase (if there is one) and starts a new one
+        @param name - the name of the phase, like "discovery" or "tokensXml"'''
+
+        if not self.enabled:
+            return
+
+        self.endPhase()
+
+        self.currentPhase = {"name": name,
+            "wallStart": time.perf_counter(),
+            "cpuStart": time.process_time(),
+            "childCpuStart": self.getChildCpu()}
+
+    def endPhase(self):
+        ''' ends the current phase and records it'''
+
+        if not self.enabled or self.currentPhase is None:
+            return
+
+        phase = self.currentPhase
+        self.currentPhase = None
+
+        self.phases.append({"name": phase["name"],
+            "wallSeconds": time.perf_counter() - phase["wallStart"],
+            "cpuSeconds": time.process_time() - phase["cpuStart"],
+            # the workers only count once they exit and we wait for them, so this shows up in the phase that joins the pool
+            "workerCpuSeconds": self.getChildCpu() - phase["childCpuStart"],
+            "peakRssMb": getPeakRssMb()})
+
+    def getChildCpu(self):
+        ''' @return the user + system cpu seconds of the child processes we have waited for, 0.0 if we can't tell'''
+
+        if resource is None:
+            return 0.0
+
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def addPage(self, timings):
+        ''' records the timings of one page that a worker returned
+        @param timings - the timing dictionary from asyncScrapePage'''
+
+        if self.enabled and timings:
+            self.pages.append(timings)
+            self.workerFinishTimes[timings["pid"]] = time.perf_counter()
+
+    def writeReport(self, reportPath, topN):
+        ''' writes the json report and prints the phase table and the table of the slowest pages
+        @param reportPath - where we write the json report to
+        @param topN - how many of the slowest pages to print'''
+
+        if not self.enabled:
+            return
+
+        self.endPhase()
+
+        # the tail of the scraping: how long the workers that ran out of work first sat there while the last one
+        # finished, and how long the slowest pages took compared to the normal ones
+        finishTimes = sorted(self.workerFinishTimes.values())
+        pageTimes = sorted(page["total"] for page in self.pages)
+
+        report = {"totalWallSeconds": time.perf_counter() - self.startTime,
+            "tokenBytes": sum(page.get("tokenBytes", 0) for page in self.pages),
+            "workerTailSeconds": finishTimes[-1] - finishTimes[0] if finishTimes else 0.0,
+            "pagePercentiles": {str(percentile): pageTimes[min(len(pageTimes) - 1, len(pageTimes) * percentile // 100)] if pageTimes else 0.0
+                for percentile in (50, 90, 99, 100)},
+            "peakRssMb": getPeakRssMb(),
+            "workerPeakRssMb": getPeakRssMb(resource.RUSAGE_CHILDREN) if resource else None,
+            "phases": self.phases,
+            "pages": sorted(self.pages, key=lambda x: x["total"], reverse=True)}
+
+        with open(reportPath, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+        print("{:<14} {:>10} {:>10} {:>12} {:>10}".format("phase", "wall s", "cpu s", "worker cpu s", "peak MB"))
+        for phase in self.phases:
+            print("{:<14} {:>10.3f} {:>10.3f} {:>12.3f} {:>10}".format(phase["name"], phase["wallSeconds"], phase["cpuSeconds"],
+                phase["workerCpuSeconds"], "{:.1f}".format(phase["peakRssMb"]) if phase["peakRssMb"] is not None else "?"))
+
+        print("{} slowest page(s):".format(min(topN, len(report["pages"]))))
+        print("{:>10} {:>10} {:>10} {:>10} {:>12} {:>10} {:>8}  {}".format("total ms", "parse ms", "extract ms", "modify ms", "serialize ms",
+            "write ms", "tokens", "page"))
+        for page in report["pages"][:topN]:
+            print("{:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>12.2f} {:>10.2f} {:>8}  {}".format(page["total"] * 1000, page["parse"] * 1000,
+                page["extract"] * 1000, page["modify"] * 1000, page["serialize"] * 1000, page["write"] * 1000, page["tokens"], page["page"]))
+
+        print("Page times: p50 {:.2f} ms, p90 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms".format(*[report["pagePercentiles"][str(percentile)] * 1000
+            for percentile in (50, 90, 99, 100)]))
+        print("Tail: the first worker to run out of pages finished {:.3f} s before the last one".format(report["workerTailSeconds"]))
+        print("The workers sent {} bytes of pickled tokens".format(report["tokenBytes"]))
+        print("Wrote the profile report to {}".format(reportPath))
+
+def dumpWorkerProfile(profiler, profilePath):
+    ''' saves a worker's cProfile stats, runs when the worker process exits
+    @param profiler - the cProfile.Profile object
+    @param profilePath - where we save the stats, open it with the pstats module or snakeviz'''
+
+    profiler.disable()
+    profiler.dump_stats(profilePath)
+
+def initScrapeWorker(srcFolder, docFolder, parser="bs4", profile=False, cProfileFolder=None, archive=False, minify=False,
+    writeQueueSize=0, writeErrorFolder=None, mtime=0):
+    ''' the initializer for every process in the pool, sets the global variables that
+    asyncScrapePage needs. These used to be manager.Value objects but every access to those
+    was a round trip to the manager process, so now each worker just gets its own copy.
+
+    @param srcFolder - the folder where the as3 documentation is located
+    @param docFolder - the Documents folder inside the .docset we are creating
+    @param parser - which parser we use, "bs4" or "lxml-native", see the --parser argument
+    @param profile - if True, asyncScrapePage returns the timings for every page, see --profile
+    @param cProfileFolder - if not None, we run this worker under cProfile and save the stats in this
+        folder when the worker exits, see --profileWorkers
+    @param archive - if True, the pages get compressed and sent back to the parent for the archive instead of
+        being written to docFolder, see --archive
+    @param minify - if True, the pages get minified before they are saved, see --minify
+    @param writeQueueSize - if more than 0, the pages are written by a PageWriter thread that can have this many pages
+        waiting, see --writeQueueSize. The folders of the pages have to exist already, see makePageFolders()
+    @param writeErrorFolder - the folder the PageWriter saves the pages it couldn't write in, when the worker exits
+    @param mtime - the timestamp of the pages in the archive with --archive, see getArchiveMtime()'''
+
+    global sourceFolder
+    global documentsFolder
+    global parserBackend
+    global profilePages
+    global archivePages
+    global minifyPages
+    global pageWriter
+    global archiveMtime
+
+    sourceFolder = srcFolder
+    documentsFolder = docFolder
+    parserBackend = parser
+    profilePages = profile
+    archivePages = archive
+    archiveMtime = mtime
+    minifyPages = minify
+
+    if writeQueueSize > 0 and not archive:
+
+        pageWriter = PageWriter(writeQueueSize, os.path.join(writeErrorFolder, "worker-{}.json".format(os.getpid())))
+
+        # like the cProfile stats below, this runs when the worker exits after pool.close(), so pool.join() in
+        # the parent waits for the last pages to be written
+        multiprocessing.util.Finalize(None, pageWriter.close, exitpriority=20)
+
+    if cProfileFolder is not None:
+
+        profiler = cProfile.Profile()
+
+        # the pool's workers run the multiprocessing finalizers when they exit after pool.close(), so we save the stats then
+        multiprocessing.util.Finalize(None, dumpWorkerProfile,
+            args=(profiler, os.path.join(cProfileFolder, "worker-{}.prof".format(os.getpid()))), exitpriority=10)
+
+        profiler.enable()
+
+def asyncGetPagesFromIndex(htmlFile):
+    ''' gets all of the pages that one of the index files links to, this runs in the pool
+    the same way asyncScrapePage does, since the index files are some of the biggest files in the documentation
+    @param htmlFile - one of the files in htmlPagesToParse
+    @return a tuple of (number of links we found, set of the normalized page links)'''
+
+    if parserBackend == "lxml-native":
+
+        with open(os.path.join(sourceFolder, htmlFile), "rb") as f:
+            linkList = lxmlGetPageLinksFromIndex(lxml.html.parse(f, lxmlUtf8Parser))
+
+    else:
+
+        # the html files are inside the Documents folder. 
+        with open(os.path.join(sourceFolder, htmlFile), "r", encoding="utf-8") as f:
+            linkList = getPageLinksFromIndex(BeautifulSoup(f))
+
+    return (len(linkList), set(linkList))
+
+def asyncScrapePage(pageLink):
+    ''' we are moving the majority of the code into here so we can use 
+    multiprocessing.Pool and have mutliple processes do the scraping.
+    So multiple processes will be executing this function, the global variables it
+    uses are set by initScrapeWorker() when the pool is created
+    @param pageLink - the key to the 'pages' dictionary (the html file's path) that we get passed in by imap_unordered
+    @return a tuple of (pageLink, tokenList, pid, warningList, timings, error, archiveMembers, writeErrors), the parent process puts the tokenList back into
+     the pages dictionary, its in the compact form from packTokenList() so theres less to pickle. The parent uses the pid of this worker for the progress report. warningList is what
+     modifyAndSaveHtml() returned. timings is None unless --profile or --minify is set, then its a dictionary of how many seconds
+     each step of the page took (and how big the page was before and after minifyHtml() with --minify). error is None, unless we failed to scrape the page, then the tokenList is None
+     and error is a dictionary with the keys "page", "phase", "type", "message" and "traceback". archiveMembers is
+     a list of (archive path, compressed member) tuples with --archive, see savePage(), and an empty list otherwise. writeErrors
+     is a list of the error records of earlier pages of this worker that the PageWriter couldn't write, see --writeQueueSize'''
+
+    # now we need to parse each 'pageLink', and return a list of token strings for it
+    # that the parent process sets as the value for the pageLink key in the pages dict
+    # the things that go in the list are the '//apple_ref/cpp/func/PyByteArray_FromObject'
+    # type strings. see http://kapeli.com/docsets/
+    #
+    # Type Mappings:
+    #
+    # Constant Static Property -> constant (clconst)
+    # Property-> property (instp)
+    # protected properties -> property (instp)
+    # Skin Part -> property (instp)
+    # skin states -> property (instp)
+    # effects -> property (instp)
+    # Event -> Event (Event)
+    # Class -> class (cl)
+    # method -> method (clm)
+    # protected method -> method (clm)
+    # Interface, package -> Interface (Interface)
+    # Style -> property (instp)
+    # mobile theme styles -> property (instp)
+    # Package -> Package (Package)
+
+    tokenList = [] # gets returned to the parent process, which puts it in the pages dict
+    warningList = [] # same
+
+    # how long each step took, these are cheap enough that we always record them, but we only send them
+    # back to the parent with --profile
+    timings = {"page": pageLink, "pid": os.getpid(), "parse": 0.0, "extract": 0.0, "modify": 0.0, "serialize": 0.0, "write": 0.0}
+    startTime = time.perf_counter()
+    startCpu = time.process_time()
+
+    # what we are doing right now, so if something goes wrong the error says where
+    phase = "parse"
+
+    # in case the last page failed half way through
+    del pendingArchiveMembers[:]
+
+    try:
+
+        if parserBackend == "lxml-native":
+
+            # parse with lxml directly and skip bs4 completely, the lxml functions do the same thing as the code below
+            with open(os.path.join(sourceFolder, pageLink), "rb") as f:
+                tree = lxml.html.parse(f, lxmlUtf8Parser)
+
+            timings["parse"] = time.perf_counter() - startTime
+            phase = "extract"
+
+            tokenList = lxmlGetTokenList(tree, pageLink)
+
+            timings["extract"] = time.perf_counter() - startTime - timings["parse"]
+            phase = "modify"
+
+            warningList = lxmlModifyAndSaveHtml(tree, os.path.join(documentsFolder, pageLink), tokenList, timings)
+
+            packedTokens = packTokenList(tokenList)
+            return (pageLink, packedTokens, os.getpid(), warningList, getPageTimings(timings, startTime, startCpu, packedTokens), None,
+                takeArchiveMembers(), takeWriteErrors())
+
+        # here we use the same soup object for scraping and passing to modifyAndSaveHtml to save processing time
+        soup = None
+
+        # scrape the page and get the tokens
+        with open(os.path.join(sourceFolder, pageLink), "r", encoding="utf-8") as f:
+
+            # make the beautifulsoup object that reprsents the html
+            soup = BeautifulSoup(f)
+
+        # index all the tags in the page with one walk through the tree, everything below looks tags up in here
+        pageIndex = PageIndex(soup)
+
+        timings["parse"] = time.perf_counter() - startTime
+        phase = "extract"
+
+        # name of the page/class, the big "title" thing on the grey bar, like "JSON" or "Top Level"
+        # this also seems to have a "non breaking backspace" at the end....strip it off
+        # 6/15/12 they changed the layout of the page and where this element is located, its Classname - AS3/Flex
+        className = str(pageIndex.getTag("h1", tagId="classProductName").string)
+
+        # the string is formatted like this now: "Button  - AS3 Flex", we just want "Button"
+        className = className[:className.find(" ")].strip() # strip non breaking backspace or something stupid
+
+        # NOTE: uncomment if we want to make this use the full qualified classname as the pageName.
+        # get the name of the package this class belongs in
+        #packageName = str(soup.find(lambda tag: tag.name == "a"
+        #    and tag.has_attr("id")
+        #    and tag["id"] == "packageName").string).strip()
+
+        # NOTE: uncomment if we want to make this use the full qualified classname as the pageName.
+        # page name is the package name + class name
+        #pageName = packageName + "." + className
+        pageName = className
+
+        # here, we test to see if this is a package html page. 
+        if os.path.basename(pageLink) == "package-detail.html":
+
+            # note that the anchor can be either "classSummary" or "interfaceSummary", so since it can 
+            # have one or both, then we just don't provide an anchor.
+            # add tuple to the list. tuple is of the format (refname, anchor)
+            tokenList.append( ("//apple_ref/cpp/Package/{}".format(pageName), "") )
+
+        else:
+
+            # normal page, find props/styles/etc
+
+            # **************************
+            # type of page (class or interface)
+            # **************************
+
+            # adds the class or interface listing to our tokenList
+            # note: we do not try and get the class type for all pages, thats why we have the check
+            # to see if there is actually a tuple before we add it to tokenList. If its none then
+            # its a weird page that isn't a class/interface (like package.html, operators.html)
+            # so we don't add it
+            tmpTuple = getClassTypeTupleFromClassSignature(pageIndex, pageName)
+
+            if tmpTuple:
+
+                tokenList.append(tmpTuple)
+
+            # **************************
+            # properties
+            # **************************
+
+            # get the table tag 
+            propertyTableTag = getTableTag("summaryTableProperty", pageIndex)
+
+            if propertyTableTag:
+                # get the tag list
+                propList = getTagListFormatOne(propertyTableTag, "a", "hideInheritedProperty", pageIndex)
+
+                # add it to tokenlist
+                tokenList.extend(getTokenAnchorTupleListFromATags(propList, "instp", pageName))
+            
+            # **************************
+            # protected properties
+            # **************************
+
+
+            # get the table tag first. This code seems to be the same as the properties one, only with different ids
+            protPropertyTableTag = getTableTag("summaryTableProtectedProperty", pageIndex)
+
+            # only continue if we actually have a table tag (and therefore properties)
+            if protPropertyTableTag:
+
+                # get as list
+                protPropList = getTagListFormatOne(protPropertyTableTag, "a", "hideInheritedProtectedProperty", pageIndex)
+
+                # add to token list
+                tokenList.extend(getTokenAnchorTupleListFromATags(protPropList, "instp", pageName))
+
+
+            # **************************
+            # methods
+            # **************************
+
+            # get table tag for protected methods
+            methodTableTag = getTableTag("summaryTableMethod", pageIndex)
+
+            # make sure we actually have methods
+            if methodTableTag:
+
+                # get as list
+                methodList = getTagListFormatTwo(methodTableTag, "a", "hideInheritedMethod", pageIndex)
+
+                # add to token list
+                tokenList.extend(getTokenAnchorTupleListFromATags(methodList, "clm", pageName))
+                
+
+            # **************************
+            # protected methods
+            # **************************
+
+            # get table tag for methods. The following code is pretty much the same as the "methods" only with different ID's and such
+            protMethodTableTag = getTableTag("summaryTableProtectedMethod", pageIndex)
+
+            # make sure we actually have protected methods
+            if protMethodTableTag:
+
+                # get as list
+                protMethodList = getTagListFormatTwo(protMethodTableTag, "a", "hideInheritedProtectedMethod", pageIndex)
+
+                # add to token list
+                tokenList.extend(getTokenAnchorTupleListFromATags(protMethodList, "clm", pageName))
+
+
+            # **************************
+            # events
+            # **************************
+
+            # get table tag
+            eventTableTag = getTableTag("summaryTableEvent", pageIndex)
+
+            # make sure we actually have events
+            if eventTableTag:
+
+                # get as list
+                eventList = getTagListFormatTwo(eventTableTag, "a", "hideInheritedEvent", pageIndex)
+
+                # add to token list
+                tokenList.extend(getTokenAnchorTupleListFromATags(eventList, "Event", pageName))
+
+
+            # **************************
+            # styles
+            # **************************
+
+            # get tables tag ( three of them)
+            styleTableTag = getTableTag(["summaryTablecommonStyle", "summaryTablesparkStyle", "summaryTablemobileStyle"], pageIndex)
+
+            # make sure we actually have styles
+            if styleTableTag:
+
+                # get as list, where we exclude all elements whose class is in our list
+                # here get span tags cause classes that have styles as links inherited them and we dont want 
+                # inherited stuff
+                styleTwoList = getTagListFormatTwo(styleTableTag, "span", ["hideInheritedcommonStyle", "hideInheritedmobileStyle", "hideInheritedsparkStyle"], pageIndex)
+
+                # add to token list. note these are span tags so we need a diff method
+                # anchors are in style of "style:SomethingHere"
+                tokenList.extend(getTokenAnchorTupleListFromSpanTags(styleTwoList, "instp", pageName, "style"))
+
+            # **************************
+            # skin parts
+            # **************************
+
+            # get table tag
+            skinPartTableTag = getTableTag("summaryTableSkinPart", pageIndex)
+
+            # if we have skin parts:
+            if skinPartTableTag:
+
+                # get as list
+                # here we only get span tags, cause the classes that have skin parts as links, have inherited the 
+                # skin parts from another class and we don't want inherited props
+                skinPartList = getTagListFormatTwo(skinPartTableTag, "span", "hideInheritedSkinPart", pageIndex)
+
+                # add to list
+                # anchor is in style of "SkinPart:SomethingHere"
+                tokenList.extend(getTokenAnchorTupleListFromSpanTags(skinPartList, "instp", pageName, "SkinPart"))
+
+            # **************************
+            # skin states
+            # **************************
+
+            # get table tag
+            skinStateTableTag = getTableTag("summaryTableSkinState", pageIndex)
+
+            # if we have skin states
+            if skinStateTableTag:
+
+                # get as list
+                # here we only get span tags cause the classes that have skin states as links have inherited the 
+                # skin states from another class and we don't want inherited stuff
+                skinStateList = getTagListFormatTwo(skinStateTableTag, "span", "hideInheritedSkinState", pageIndex)
+
+                # add to list
+                # anchors are of the format "SkinState:SomethingHere"
+                tokenList.extend(getTokenAnchorTupleListFromSpanTags(skinStateList, "instp", pageName, "SkinState"))
+
+
+            # **************************
+            # effects
+            # **************************
+
+            # get table tag
+            effectTableTag = getTableTag("summaryTableEffect", pageIndex)
+
+            # if we have effects
+            if effectTableTag:
+
+                # get as list
+                # here we only get span tags cause the classes that have effects as links have inherited the 
+                # effect from another class and we don't want inherited stuff
+                effectList = getTagListFormatTwo(effectTableTag, "span", "hideInheritedEffect", pageIndex)
+
+                # add to list
+                # anchors are of the format "effect:SomethingHere"
+                tokenList.extend(getTokenAnchorTupleListFromSpanTags(effectList, "instp", pageName, "effect"))
+
+            # **************************
+            # constants
+            # **************************
+
+            # get table tag
+            constTableTag = getTableTag("summaryTableConstant", pageIndex)
+
+            # if we have constants:
+            if constTableTag:
+
+                # get as list
+                constList = getTagListFormatOne(constTableTag, "a", "hideInheritedConstant", pageIndex)
+
+                # add to list
+                tokenList.extend(getTokenAnchorTupleListFromATags(constList, "clconst", pageName))
+
+        timings["extract"] = time.perf_counter() - startTime - timings["parse"]
+        phase = "modify"
+
+        # now that we have gotten all of the tokens, we need to modify and save the html to the 
+        # Documents folder within the docset we created
+        # this is also where we add the anchor links for the Dash TOC (anchor links that have the appleref link 
+        warningList = modifyAndSaveHtml(soup, os.path.join(documentsFolder, pageLink), tokenList, pageIndex, timings)
+
+    except Exception as e:
+
+        # don't return half a token list for a page we couldn't finish, the parent prints the error
+        error = {"page": pageLink,
+            "phase": phase,
+            "type": type(e).__name__,
+            "message": str(e),
+            "traceback": traceback.format_exc()}
+
+        return (pageLink, None, os.getpid(), warningList, getPageTimings(timings, startTime, startCpu, None), error, [],
+            takeWriteErrors())
+
+    packedTokens = packTokenList(tokenList)
+    return (pageLink, packedTokens, os.getpid(), warningList, getPageTimings(timings, startTime, startCpu, packedTokens), None,
+        takeArchiveMembers(), takeWriteErrors())
+
+def takeArchiveMembers():
+    ''' @return the list of archive members that savePage() made for the page we just did, and empties it'''
+
+    memberList = list(pendingArchiveMembers)
+    del pendingArchiveMembers[:]
+    return memberList
+
+def takeWriteErrors():
+    ''' @return the list of write errors that savePage() got from the PageWriter, and empties it'''
+
+    errorList = list(pendingWriteErrors)
+    del pendingWriteErrors[:]
+    return errorList
+
+def asyncScrapePageBatch(pageLinks):
+    ''' scrapes a batch of pages in the pool, see getPageBatches()
+    @param pageLinks - the list of pages to scrape
+    @return a list of what asyncScrapePage() returned for each page'''
+
+    return [asyncScrapePage(pageLink) for pageLink in pageLinks]
+
+def getPageBatches(pageLinks, pageSizes, batchBytes, numberOfProcesses):
+    ''' splits the pages into batches for the pool, biggest pages first. The pages range from tiny interface
+    pages to multi-megabyte ones like UIComponent.html, so if a big page gets handed out at the end the other workers
+    just sit there waiting for it. Handing out the biggest ones first means the end of the run is all small pages,
+    and grouping the small pages into batches means less back and forth with the pool.
+    The batches get smaller as we go (each one is at most half of what every worker would get if we split up the
+    rest evenly), and the pool hands out a batch to whatever worker is free, so the small batches at the end balance things out.
+
+    @param pageLinks - the pages to scrape
+    @param pageSizes - dictionary of pageLink -> size of the source html file in bytes
+    @param batchBytes - the most bytes of html that go in one batch, a page bigger than this gets a batch to itself
+    @param numberOfProcesses - how many workers there are
+    @return a list of lists of pages, the batches with the biggest pages are first'''
+
+    remainingBytes = sum(pageSizes[pageLink] for pageLink in pageLinks)
+
+    batchList = []
+    currentBatch = []
+    currentBytes = 0
+
+    for pageLink in sorted(pageLinks, key=lambda x: pageSizes[x], reverse=True):
+
+        currentBatch.append(pageLink)
+        currentBytes += pageSizes[pageLink]
+
+        if currentBytes >= min(batchBytes, remainingBytes / (numberOfProcesses * 2)):
+            batchList.append(currentBatch)
+            remainingBytes -= currentBytes
+            currentBatch = []
+            currentBytes = 0
+
+    if currentBatch:
+        batchList.append(currentBatch)
+
+    return batchList
+
+def getPageTimings(timings, startTime, startCpu, packedTokens):
+    ''' finishes the timings dictionary for a page that asyncScrapePage() returns
+    @param timings - the dictionary with the parse, extract, serialize and write times filled in
+    @param startTime - the time.perf_counter() value from when we started on the page
+    @param startCpu - the time.process_time() value from when we started on the page
+    @param packedTokens - the tokens we found on the page, from packTokenList()
+    @return the timings dictionary, or None if --profile and --minify are not set'''
+
+    if not profilePages:
+        # with just --minify the parent only wants the page sizes that savePage() put in
+        return timings if minifyPages else None
+
+    timings["total"] = time.perf_counter() - startTime
+    timings["cpu"] = time.process_time() - startCpu
+    timings["tokens"] = getTokenCount(packedTokens)
+
+    # how many bytes the tokens take up when they get sent to the parent
+    timings["tokenBytes"] = len(pickle.dumps(packedTokens, pickle.HIGHEST_PROTOCOL))
+
+    # the modify step is whatever is left over
+    timings["modify"] = max(0.0, timings["total"] - timings["parse"] - timings["extract"] - timings["serialize"] - timings["write"])
+
+    return timings
+
+
+class ServeCache:
+    ''' the cache of rewritten pages for --serve. The pages are kept in memory up to a number of bytes, and the
+    least recently used ones get dropped when we go over that. asyncScrapePage() writes every page it rewrites to the
+    spill folder anyway, so a page that got dropped from memory is read back from there instead of being scraped again.
+    This also keeps the tokens of every page we have scraped so far, for the search.'''
+
+    def __init__(self, maxBytes, spillFolder):
+        ''' constructor
+        @param maxBytes - how many bytes of pages we keep in memory
+        @param spillFolder - the folder that asyncScrapePage() writes the rewritten pages to'''
+
+        self.maxBytes = maxBytes
+        self.spillFolder = spillFolder
+        self.memoryPages = collections.OrderedDict() # pageLink -> bytes, least recently used first
+        self.memoryBytes = 0
+        self.pages = {} # pageLink -> compact token list, for every page we have scraped, like the pages dict in makeDocset()
+
+        # protects the dictionaries above. Its not held while a page is scraped, so one slow page doesn't hold up
+        # the other requests
+        self.lock = threading.Lock()
+
+        # pageLink -> a lock that is held while the page is scraped and read back, so two requests for the same
+        # page don't both scrape it and write the same file in the spill folder at once
+        self.pageLocks = {}
+
+    def getPage(self, pageLink):
+        ''' gets a rewritten page, scraping it first if we haven't yet
+        @param pageLink - the path of the page, relative to the documentation folder
+        @return the rewritten page as bytes, or None if we couldn't scrape it'''
+
+        with self.lock:
+
+            data = self.memoryPages.get(pageLink)
+
+            if data is not None:
+                self.memoryPages.move_to_end(pageLink)
+                return data
+
+            pageLock = self.pageLocks.setdefault(pageLink, threading.Lock())
+
+        with pageLock:
+
+            with self.lock:
+                scraped = pageLink in self.pages
+
+            if not scraped:
+
+                startTime = time.perf_counter()
+
+                makePageFolders(self.spillFolder, [pageLink])
+                pageLink, tokenList, pid, warningList, timings, error, archiveMembers, writeErrors = asyncScrapePage(pageLink)
+
+                if error:
+                    print("[ERROR]: failed to scrape {} while doing the {} step: {}: {}".format(pageLink, error["phase"],
+                        error["type"], error["message"]))
+                    return None
+
+                with self.lock:
+                    self.pages[pageLink] = tokenList
+
+                print("Scraped {} in {:.1f} ms, {} token(s)".format(pageLink, (time.perf_counter() - startTime) * 1000, getTokenCount(tokenList)))
+
+            # either we just scraped it or it was dropped from memory, either way its in the spill folder
+            with open(os.path.join(self.spillFolder, pageLink), "rb") as f:
+                data = f.read()
+
+        with self.lock:
+
+            if pageLink in self.memoryPages:
+                # another request for the page put it back first
+                self.memoryBytes -= len(self.memoryPages.pop(pageLink))
+
+            self.memoryPages[pageLink] = data
+            self.memoryBytes += len(data)
+
+            while self.memoryBytes > self.maxBytes and len(self.memoryPages) > 1:
+                self.memoryBytes -= len(self.memoryPages.popitem(last=False)[1])
+
+            return data
+
+    def search(self, query, limit):
+        ''' searches the tokens of the pages we have scraped so far
+        @param query - the text to look for in the token names, not case sensitive
+        @param limit - the most results we return
+        @return a list of dictionaries with the keys "name", "type" and "path", like the rows of docSet.dsidx'''
+
+        query = query.lower()
+        resultList = []
+
+        with self.lock:
+
+            for pageLink, tokenList in sorted(self.pages.items()):
+
+                for appleRef, anchor in unpackTokenList(tokenList):
+
+                    # //apple_ref/cpp/TYPE/name, and name can have slashes in it
+                    refType, name = appleRef.split("/", 5)[4:]
+
+                    if query in name.lower():
+
+                        # the same path as the docSet.dsidx rows, see writeSqliteIndex()
+                        resultList.append({"name": name,
+                            "type": dashEntryTypes.get(refType, refType),
+                            "path": "/" + pageLink + "#" + anchor if anchor else "/" + pageLink})
+
+                        if len(resultList) >= limit:
+                            return resultList
+
+        return resultList
+
+# the most results /search returns, whatever limit is asked for
+maxSearchResults = 1000
+
+class ServeRequestHandler(http.server.BaseHTTPRequestHandler):
+    ''' handles the requests for --serve. Pages get rewritten the first time they are asked for,
+    /search?q=something searches the tokens we have so far and everything else comes straight from
+    the documentation folder. The server object has the sourceFolder, cache and quiet attributes'''
+
+    def do_GET(self):
+        ''' handles a GET request'''
+
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path).lstrip("/")
+
+        if path == "":
+
+            # the same page that Nodes.xml points dash at
+            self.send_response(302)
+            self.send_header("Location", "/package-list.html")
+            self.end_headers()
+            return
+
+        if path == "search":
+
+            query = urllib.parse.parse_qs(url.query)
+
+            try:
+                limit = int(query.get("limit", ["100"])[0])
+            except ValueError:
+                self.send_error(400, "limit has to be a number")
+                return
+
+            resultList = self.server.cache.search(query.get("q", [""])[0], max(1, min(limit, maxSearchResults)))
+            self.sendData(json.dumps(resultList).encode("utf-8"), "application/json")
+            return
+
+        pageLink = os.path.normpath(path)
+        sourcePath = os.path.join(self.server.sourceFolder, pageLink)
+
+        # don't let anyone get out of the documentation folder with ../
+        if pageLink.startswith("..") or os.path.isabs(pageLink) or not os.path.isfile(sourcePath):
+            self.send_error(404)
+            return
+
+        data = None
+
+        if pageLink in modifiedCssFiles:
+            data = getModifiedCss(sourcePath, pageLink).encode("utf-8")
+
+        elif pageLink.endswith(".html") and pageLink not in staticFiles and pageLink not in htmlPagesToParse:
+            # every other html page is a class or package page that the build would scrape
+            data = self.server.cache.getPage(pageLink)
+
+        if data is None:
+
+            # static file, or a page we couldn't scrape, which is better than nothing
+            with open(sourcePath, "rb") as f:
+                data = f.read()
+
+        self.sendData(data, mimetypes.guess_type(pageLink)[0] or "application/octet-stream")
+
+    def sendData(self, data, contentType):
+        ''' sends a 200 response
+        @param data - the body, as bytes
+        @param contentType - the content type header'''
+
+        if contentType.startswith("text/") or contentType == "application/json":
+            contentType += "; charset=utf-8"
+
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        ''' only log the requests if --quiet is not set'''
+
+        if not self.server.quiet:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+def serveDocs(args):
+    ''' serves the documentation over http, rewriting the pages the same way makeDocset() does but only
+    when they are asked for, so you can look at the pages without waiting for a whole build
+    @param args - the argument parser namespace object'''
+
+    spillFolder = tempfile.mkdtemp(prefix="as3serve")
+
+    # the server thread does the scraping in this process, so it uses the worker globals too
+    initScrapeWorker(args.docPath, spillFolder, args.parser, minify=args.minify)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), ServeRequestHandler)
+    server.sourceFolder = args.docPath
+    server.cache = ServeCache(args.serveCacheSize * 1024 * 1024, spillFolder)
+    server.quiet = args.quiet
+
+    print("Serving {} at http://127.0.0.1:{}/, search the tokens at http://127.0.0.1:{}/search?q=something".format(args.docPath,
+        args.port, args.port))
+    print("Press ctrl+c to stop")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        shutil.rmtree(spillFolder)
+
+def makeDocset(args):
     ''' does the work to make the docset
         @param args - the argument parser namespace object
         '''
-    pool = Pool(processes=args.numberOfProcesses)
+    # records how long every phase takes with --profile, otherwise it doesn't do anything
+    profiler = BuildProfiler(args.profile)
+    profiler.startPhase("setup")
+
+    # a bare --numberOfProcesses means every core, like Pool(None) does, but getPageBatches() needs the actual number
+    if args.numberOfProcesses is None:
+        args.numberOfProcesses = os.cpu_count() or 1
 
     print("using {} process(es) to scrape the html pages".format(args.numberOfProcesses))
 
-    if not args.noDocsetutil:
+    if not args.noDocsetutil and not args.sqliteIndex:
         ## Tries to find docsetutil
         possibleDocsetutilPath= [
             "/Developer/usr/bin/docsetutil",
@@ -1093,21 +3004,61 @@ def makeDocset(args):
         ]
         docsetutilPath = [path for path in possibleDocsetutilPath if os.path.exists(path)]
         if len(docsetutilPath) == 0:
-            trouble("Could not find docsetutil. Please check for docsetutil's location and set it inside the script.")
+            trouble("Could not find docsetutil. Please check for docsetutil's location and set it inside the script, or use --sqliteIndex.")
 
         docsetutilPath = docsetutilPath[0]
 
     
     #import pdb;pdb.set_trace()
-    global sourceFolder # note this is a manager.Value object
-    sourceFolder.value = args.docPath
+    sourceFolder = args.docPath
 
     # destination folder of the main as3.docset folder/file/thing
     docsetFolder = os.path.join(args.outputPath,"as3.docset")
 
 
+    # the manifest lives next to the docset, so it survives the docset being deleted. it's not a problem if
+    # its out of date since we check that the output html files still exist before we use anything from it
+    manifestPath = docsetFolder + ".manifest.json"
+
+    # every build writes the pages it couldn't scrape here, so they can be redone with --onlyPages
+    failedPagesPath = docsetFolder + ".failed.txt"
+
+    # with --archive, the docset is one .tgz file instead of a folder
+    archivePath = docsetFolder + ".tgz"
+    archive = None
+
+    if args.archive:
+
+        if args.incremental or args.onlyPages:
+            trouble("--archive can't be used with --incremental or --onlyPages, the archive is always made from scratch")
+
+        if not args.sqliteIndex and not args.noDocsetutil:
+            trouble("--archive needs --sqliteIndex or --noDocsetutil, docsetutil only works on a docset folder")
+
+        if os.path.exists(archivePath) and not args.deleteExisting:
+            print("[ERROR]: the output archive already exists at {} and --deleteExisting was not set, so i'm NOT overwriting it!".format(archivePath))
+            sys.exit(1)
+
+    # the asset store is hardlinked into the docset folder, so theres nothing to link with --archive
+    assetStore = None
+
+    if args.assetStore:
+
+        if args.archive:
+            trouble("--assetStore can't be used with --archive, the archive has its own copy of every file")
+
+        if args.linkStatic:
+            trouble("--assetStore can't be used with --linkStatic, the static files are already hardlinked from the asset store")
+
+        assetStore = AssetStore(args.assetStore)
+
+    # --onlyPages updates the existing docset, so it needs to be there
+    if args.onlyPages and not os.path.exists(manifestPath):
+        trouble("--onlyPages needs the docset and manifest from a previous build, but there is no manifest at {}".format(manifestPath))
+
     ## Clean up first if the output folders already exist
-    if os.path.exists(docsetFolder):
+    # unless we are doing an incremental build, then we want to keep the existing docset and update it
+    if os.path.exists(docsetFolder) and not args.incremental and not args.onlyPages:
         if (args.deleteExisting):
             print("removing old output folders at {}".format(docsetFolder))
             shutil.rmtree(docsetFolder)
@@ -1118,7 +3069,7 @@ def makeDocset(args):
     print("Docset being saved to: {}".format(docsetFolder))
 
     ## Create all the necessary folder hierarchy. 
-    os.makedirs(os.path.join(docsetFolder,"Contents", "Resources", "Documents"))
+    os.makedirs(os.path.join(docsetFolder,"Contents", "Resources", "Documents"), exist_ok=True)
     contentsFolder = os.path.join(docsetFolder, "Contents")
 
     ## Create Info.plist
@@ -1134,17 +3085,19 @@ def makeDocset(args):
             <key>CFBundleName</key>
             <string>Actionscript 3</string>
             <key>DocSetPlatformFamily</key>
-            <string>as3</string>
+            <string>as3</string>{}
         </dict>
         </plist>
-        """)
+        """.format("""
+            <key>isDashDocset</key>
+            <true/>""" if args.sqliteIndex else "")) # tells dash to use our docSet.dsidx
 
     #Find the module's index file. This is the as3's package-list.html file. 
     #This is just a XML file that points to the main index file of your documentation
     possibleModindexPath = [
         "package-list.html"
     ]
-    modindexPath = [path for path in possibleModindexPath if os.path.exists(sourceFolder.value + path)]
+    modindexPath = [path for path in possibleModindexPath if os.path.exists(os.path.join(sourceFolder, path))]
 
     # if we couldn't find the package index
     if len(modindexPath) == 0:
@@ -1168,96 +3121,300 @@ def makeDocset(args):
         """.format(modindexPath))
 
     # var to the  Documents folder inside the .docset file
-    global documentsFolder # note this is a manager.Value object
-    documentsFolder.value = os.path.join(resourcesFolder ,"Documents")
+    documentsFolder = os.path.join(resourcesFolder ,"Documents")
 
-    # copy over static files, images, scripts, pages that don't get transferred automatically
-    # and modify them if necessary
-    copyAndModifyStaticFilesToDocs(sourceFolder.value, documentsFolder.value)
+    # with --profileWorkers, every worker saves its cProfile stats in here
+    cProfileFolder = None
+    if args.profileWorkers:
+        cProfileFolder = docsetFolder + ".profile"
+        os.makedirs(cProfileFolder, exist_ok=True)
+        print("Saving the cProfile stats of every worker to {}".format(cProfileFolder))
 
-    
+    # with --writeQueueSize, the workers save the pages they couldn't write here when they exit, see PageWriter
+    writeErrorFolder = tempfile.mkdtemp(prefix="as3writeErrors")
 
-    # NOTE: pages is a dictionary, and is manager.dict object
+    # the time of every file in the archive, the workers need it too since they compress the pages
+    archiveMtime = getArchiveMtime() if args.archive else 0
+
+    profiler.startPhase("poolStartup")
+
+    # the pool is used for finding the pages in the index files first, then for scraping them
+    # NOTE: this has to be created before any threads are started, since the workers are forked
+    pool = Pool(processes=args.numberOfProcesses, initializer=initScrapeWorker,
+        initargs=(sourceFolder, documentsFolder, args.parser, args.profile, cProfileFolder, args.archive, args.minify,
+            args.writeQueueSize, writeErrorFolder, archiveMtime))
+
+    profiler.startPhase("discovery")
 
     print("Figuring out what files we need to parse")
     # get all the pages that we need to parse. uses the htmlPagesToParse list defined at the top
-    for htmlFile in htmlPagesToParse:
+    # every worker gives us back the set of pages that one index file links to, and we combine them
+    rawLinkCount = 0
+    pageLinks = set()
 
-        # the html files are inside the Documents folder. 
-        with open(os.path.join(sourceFolder.value, htmlFile), "r", encoding="utf-8") as f:
+    for linkCount, linkSet in pool.imap_unordered(asyncGetPagesFromIndex, htmlPagesToParse):
 
-            # create the soup
-            soup = BeautifulSoup(f)
+        rawLinkCount += linkCount
+        pageLinks.update(linkSet)
+
+    print("Found {} links in the index files, which are {} unique pages".format(rawLinkCount, len(pageLinks)))
+
+    # dictionary that will hold the pages
+    # key is the html files path, and value is a list of 
+    # tuple objects, the first value is the strings that will will be of the format //apple_ref/language/type/name
+    # that identifies the various classes, properties, styles, etc inside each html file. The second is the 'anchor'
+    # The list is kept in the compact form from packTokenList() until we write it out, None means no tokens.
+    # NOTE: this is a normal dictionary that only lives in this process, the workers return their
+    # token lists to us and we fill it in here. Its sorted so we go through the pages in the same order every time
+    pages = {pageLink: None for pageLink in sorted(pageLinks)}
+
+    # copy over static files, images, scripts, pages that don't get transferred automatically
+    # and modify them if necessary. This happens on threads while the pages are being scraped, the pages
+    # themselves are skipped since the workers write them
+    # with --archive, the parent adds the static files to the archive after the pages instead
+    staticExecutor = ThreadPoolExecutor(max_workers=4)
+    staticFutures = []
+
+    if args.archive:
+        print("Docset archive being saved to: {}".format(archivePath))
+        archive = DocsetArchive(archivePath, archiveMtime)
+    else:
+        # the workers don't make the folders for the pages, see makePageFolders()
+        makePageFolders(documentsFolder, pages)
+        staticFutures = copyAndModifyStaticFilesToDocs(sourceFolder, documentsFolder, staticExecutor, args.linkStatic, pages, assetStore)
+
+    profiler.startPhase("hashing")
+
+    # hash every page so we know which ones changed since the last build
+    pageHashes = {pageLink: getFileHash(os.path.join(sourceFolder, pageLink)) for pageLink in pages.keys()}
+
+    # and get their sizes so we can hand out the big ones first, see getPageBatches()
+    pageSizes = {pageLink: os.path.getsize(os.path.join(sourceFolder, pageLink)) for pageLink in pages.keys()}
+
+    pagesToScrape = list(pages.keys())
+
+    if args.onlyPages:
+
+        # only scrape the pages in the list, and use the tokens from the last build for the rest
+        onlyPageSet = set(loadPageList(args.onlyPages))
+        oldManifest = loadManifest(manifestPath)
+
+        pagesToScrape = [pageLink for pageLink in pages.keys() if pageLink in onlyPageSet]
+        missingPages = []
+
+        for pageLink in pages.keys():
+
+            if pageLink not in onlyPageSet:
+
+                if pageLink in oldManifest:
+                    pages[pageLink] = oldManifest[pageLink][1]
+                else:
+                    missingPages.append(pageLink)
+
+        for pageLink in sorted(onlyPageSet - set(pages.keys())):
+            print("[WARNING]: {} is in {} but not in the index files, skipping it".format(pageLink, args.onlyPages))
+
+        if missingPages:
+            print("[WARNING]: {} page(s) are not in --onlyPages and not in the manifest either, they won't have any tokens".format(len(missingPages)))
+
+        print("Only scraping the {} page(s) in {}".format(len(pagesToScrape), args.onlyPages))
+
+    elif args.incremental:
+
+        # reuse the tokens for all the pages whose html is the same as last time, as long as we still
+        # have the rewritten html file from the last build
+        oldManifest = loadManifest(manifestPath)
+        pagesToScrape = []
+
+        for pageLink in pages.keys():
+
+            oldEntry = oldManifest.get(pageLink)
+
+            if oldEntry and oldEntry[0] == pageHashes[pageLink] and os.path.exists(os.path.join(documentsFolder, pageLink)):
+                pages[pageLink] = oldEntry[1]
+            else:
+                pagesToScrape.append(pageLink)
 
-            getPagesFromIndex(soup, pages)
+        # delete the pages from the last build that are not in the documentation anymore
+        for pageLink in oldManifest.keys():
+            if pageLink not in pages and os.path.exists(os.path.join(documentsFolder, pageLink)):
+                os.remove(os.path.join(documentsFolder, pageLink))
 
+        print("Incremental build: {} page(s) unchanged, {} page(s) need to be scraped".format(len(pages) - len(pagesToScrape), len(pagesToScrape)))
 
+    profiler.startPhase("scraping")
 
-    # set the total number of pages. This is a multiprocessing.Value object
-    total.value = len(pages)
+    total = len(pagesToScrape)
 
     # only send the KEY of the pages dict (which is the html file's path), and then
-    # in asyncScrapePage, we can use that key to get the list that we want to modify 
-    # from the shared pages dict.
+    # asyncScrapePage returns (pageLink, tokenList) tuples that we put back into the pages dict
+    # as they finish, in whatever order they finish in.
     # split the work among multiple processes
-    pool.map(asyncScrapePage, pages.keys())
-  
-    # now create the soup object that will be written to Tokens.xml
-    # the format of this file is
-    # <Tokens>
-    #   <File>
-    #       <Token>
-    #           <TokenIdentifier>
-    #           <Anchor>
-    #   ... more <File> tags
+    progress = ProgressReporter(total, args.progressInterval, args.quiet)
 
-    #import pdb;pdb.set_trace()
-    # bs4 object that will represent the xml file we are creating. 
-    tokenSoup = BeautifulSoup('''<?xml version="1.0" encoding="UTF-8"?> 
-    <Tokens version="1.0"></Tokens>''', "xml") # this requires bs4 beta 9 at least or else the xml declaration is bugged.
+    # all the warnings that the workers give us back
+    allWarnings = []
+
+    # the error records of the pages that failed, see asyncScrapePage()
+    allErrors = []
+
+    # (pageLink, bytes before, bytes after) for every page with --minify
+    minifySizes = []
+    tooManyErrors = False
+
+    if args.schedule == "size":
+        # batches of pages, biggest first, and we go through the results of every batch one page at a time
+        batchList = getPageBatches(pagesToScrape, pageSizes, args.batchBytes, args.numberOfProcesses)
+        resultIterator = (result for resultList in pool.imap_unordered(asyncScrapePageBatch, batchList) for result in resultList)
+    else:
+        resultIterator = pool.imap_unordered(asyncScrapePage, pagesToScrape, args.chunksize)
+
+    for pageLink, tokenList, pid, warningList, timings, error, archiveMembers, writeErrors in resultIterator:
+
+        pages[pageLink] = tokenList
+
+        for archiveName, member in archiveMembers:
+            archive.spoolMember(archiveName, member)
+
+        allWarnings.extend(warningList)
+        profiler.addPage(timings)
+
+        if timings and "minifiedBytes" in timings:
+            minifySizes.append((pageLink, timings["htmlBytes"], timings["minifiedBytes"]))
+        progress.pageDone(pid)
+
+        if error:
+
+            allErrors.append(error)
+            print("[ERROR]: PID: {} - failed to scrape {} while doing the {} step: {}: {}".format(pid, pageLink,
+                error["phase"], error["type"], error["message"]))
+            print(error["traceback"])
+
+        # earlier pages of this worker that it couldn't write, the worker finds out when it saves its next page
+        for writeError in writeErrors:
+
+            pages[writeError["page"]] = None
+            allErrors.append(writeError)
+            print("[ERROR]: PID: {} - failed to write {}: {}: {}".format(pid, writeError["page"], writeError["type"],
+                writeError["message"]))
+            print(writeError["traceback"])
+
+        if args.maxErrors is not None and len(allErrors) > args.maxErrors:
+            tooManyErrors = True
+            break
+
+    if tooManyErrors:
+        # don't waste time on the rest of the pages, the input is probably broken
+        pool.terminate()
+    else:
+        pool.close()
+
+    pool.join()
+
+    # the last pages that the workers' PageWriters couldn't write, the workers saved those when they exited
+    writeErrors = loadWriteErrors(writeErrorFolder)
+    shutil.rmtree(writeErrorFolder)
+
+    for error in writeErrors:
+
+        pages[error["page"]] = None
+        allErrors.append(error)
+        print("[ERROR]: failed to write {}: {}: {}".format(error["page"], error["type"], error["message"]))
+        print(error["traceback"])
+
+    if writeErrors and args.maxErrors is not None and len(allErrors) > args.maxErrors:
+        tooManyErrors = True
+
+    if allErrors:
+
+        # group the errors so hundreds of pages failing the same way is one line
+        errorGroups = {}
+        for error in allErrors:
+            errorGroups.setdefault((error["phase"], error["type"]), []).append(error)
+
+        print("[ERROR]: {} page(s) failed:".format(len(allErrors)))
+        for (phase, errorType), errorList in sorted(errorGroups.items(), key=lambda x: len(x[1]), reverse=True):
+            print("[ERROR]:     {} page(s) in the {} step with {}, like {}: {}".format(len(errorList), phase, errorType,
+                errorList[0]["page"], errorList[0]["message"]))
+
+        print("[ERROR]: the failed pages are listed in {}, run again with --onlyPages {} to redo just those".format(failedPagesPath,
+            failedPagesPath))
+
+        # a failed page might still have its html from an earlier build (--incremental, --onlyPages), remove it so
+        # the docset doesn't have an old copy of it that the next incremental build thinks is fine
+        if not args.archive:
+            for error in allErrors:
+                stalePath = os.path.join(documentsFolder, error["page"])
+                if os.path.isfile(stalePath):
+                    os.remove(stalePath)
+
+    # write the list every time, so a list from an earlier build doesn't stick around
+    savePageList(failedPagesPath, [error["page"] for error in allErrors])
+
+    if tooManyErrors:
 
-    # the tag that are adding <File> tags too
-    soupTokensTag = tokenSoup.find("Tokens")
+        staticExecutor.shutdown(cancel_futures=True)
 
-    # go through our pages dictionary
-    for pageHref, tokenList in pages.items():
+        # the archive and the folder it was being made in are only half done
+        if archive:
+            archive.abort()
+            shutil.rmtree(docsetFolder)
+
+        trouble("[ERROR]: stopping, more than --maxErrors ({}) pages failed".format(args.maxErrors))
+
+    profiler.startPhase("staticCopy")
+
+    # wait for the static files to be done, this raises the exception if any of them failed
+    for future in staticFutures:
+        future.result()
 
-        # the file tag that will contain everything for this page
-        fileTag = tokenSoup.new_tag("File", path=pageHref)
+    if assetStore:
+        assetStore.printSummary()
 
-        # we seem to only write <file> tags if there are actually any tokens to write.
-        for tmpTuple in tokenList:
+    if archive:
+        archive.addSpooledMembers()
+        addStaticFilesToArchive(sourceFolder, archive, pages)
 
-            # Token tag that will hold the tokenidentifier and anchor tags
-            iterToken = tokenSoup.new_tag("Token")
+    staticExecutor.shutdown()
 
-            # create the TokenIdentifier and Anchor tags
-            idTag = tokenSoup.new_tag("TokenIdentifier")
-            idTag.append(tmpTuple[0]) # the identifier
-            iterToken.append(idTag)
+    if allWarnings:
 
-            if tmpTuple[1] != "": # don't add an anchor for empty strings as anchors, they don't have one!
-                anchorTag = tokenSoup.new_tag("Anchor")
-                anchorTag.append(tmpTuple[1]) # the anchor
-                iterToken.append(anchorTag)
+        for warning in sorted(allWarnings, key=lambda x: x["page"]):
+            print("[WARNING]: {}: {}".format(warning["page"], warning["message"]))
 
-            # add to file tag
-            fileTag.append(iterToken)
+        print("[WARNING]: {} token(s) on {} page(s) had an anchor that doesn't exist in the page".format(len(allWarnings),
+            len(set(x["page"] for x in allWarnings))))
 
-        # add file tag to the Tokens tag only if we have tokens in our tokens list
-        if len(tokenList) > 0:
+    if args.minify and minifySizes:
+        writeMinifyReport(docsetFolder + ".minify.json", minifySizes, args.profileTopN)
 
-            soupTokensTag.append(fileTag)
+    profiler.startPhase("manifest")
 
+    print("Creating {}".format(manifestPath))
+    saveManifest(manifestPath, pages, pageHashes, set(error["page"] for error in allErrors))
+  
+    profiler.startPhase("tokensXml")
 
     # now we write to the tokens.xml file. 
     print("Creating {}".format(os.path.join(resourcesFolder, "Tokens.xml")))
-    with open(os.path.join(resourcesFolder, "Tokens.xml"), "w", encoding="utf-8") as f:
+    writeTokensXml(os.path.join(resourcesFolder, "Tokens.xml"), pages)
+
+
+    if args.sqliteIndex:
+        profiler.startPhase("sqliteIndex")
+
+        # create the search index ourselves
+        print("Creating {}".format(os.path.join(resourcesFolder, "docSet.dsidx")))
+        writeSqliteIndex(os.path.join(resourcesFolder, "docSet.dsidx"), pages)
 
-        f.write(str(tokenSoup))
+        # Cleanup the xml files as they are not needed anymore
+        print("Cleaning up Nodes.xml and Tokens.xml")
+        os.remove(os.path.join(docsetFolder, "Contents", "Resources", "Nodes.xml"))
+        os.remove(os.path.join(docsetFolder, "Contents", "Resources", "Tokens.xml"))
 
+    elif not args.noDocsetutil:
+        profiler.startPhase("docsetutil")
 
-    if not args.noDocsetutil:
         # call apple's docset utility
         print("Calling docsetutil")
         resultCode = subprocess.call([docsetutilPath, "index", docsetFolder])
@@ -1273,19 +3430,36 @@ def makeDocset(args):
         print("Creating the token files done. You still need to run 'docsetutil index as3.docset'" +
             " in order  for this to work with dash!")
 
-    print("Done!")
+    if archive:
 
-if __name__ == "__main__":
-    # if we are being run as a real program
+        # the docset folder just has Info.plist and the index files in it now, they go in the archive too
+        print("Adding the docset files to {}".format(archivePath))
+        for root, dirs, files in os.walk(docsetFolder):
 
-    # the script does NOT seem to work if lxml is not installed
-    # bs4 needs lxml or else it wont be able to find elements for 
-    # some reason!
-    try:
-        import lxml
-    except ImportError as e:
+            dirs.sort()
+            for fileName in sorted(files):
+                filePath = os.path.join(root, fileName)
+                archive.addFile("as3.docset/" + os.path.relpath(filePath, docsetFolder).replace(os.sep, "/"), filePath)
 
-        trouble("lxml is not installed! the script does not seem to work without lxml, see www.lxml.de. Error: {}".format(e))
+        archive.close()
+        shutil.rmtree(docsetFolder)
+
+        print("Wrote {} with {} files, the index is {}".format(archivePath, len(archive.members), archive.indexPath))
+
+    profiler.writeReport(docsetFolder + ".profile.json", args.profileTopN)
+
+    # the docset is made without the failed pages, but the build still failed
+    if allErrors:
+        trouble("[ERROR]: finished, but {} page(s) failed, see {}".format(len(allErrors), failedPagesPath))
+
+    print("Done!")
+
+    return pages
+
+def getArgumentParser():
+    ''' creates the argument parser for this script, its in its own method so other scripts
+    (like benchmark_as3_docset.py) can create the same arguments that makeDocset() expects
+    @return the argparse.ArgumentParser object'''
 
     parser = argparse.ArgumentParser(description="create a .docset file for the as3 documentation", 
         epilog="Copyright 2012 Mark Grandi, forked from https://github.com/gpambrozio/PythonScripts")
@@ -1297,17 +3471,104 @@ if __name__ == "__main__":
 
     parser.add_argument("--noDocsetutil", action="store_true", default=False, help="Whether or not we should attempt to run docsetutil or not.")
 
+    parser.add_argument("--sqliteIndex", action="store_true", default=False, help="create dash's docSet.dsidx search index directly instead of \
+                        running docsetutil, this works on any OS, not just OSX with Xcode installed")
+
     parser.add_argument("--numberOfProcesses", type=int, default=1,  nargs="?", help="the number of processes to use to scrape the docs. You should only \
-                        use as many processes as you have PHYSICAL cores on your machine. An additional process is spawned to help with data \
-                        sharing in addition to the main python process (so if you select 2, you have 4 processes, but only 2 doing the grunt work")
+                        use as many processes as you have PHYSICAL cores on your machine. Without a number it uses every core.")
+
+    parser.add_argument("--parser", choices=["bs4", "lxml-native"], default="bs4", help="bs4 parses the pages with BeautifulSoup, \
+                        lxml-native uses lxml directly with precompiled xpath expressions, which is a lot faster. The tokens are the same")
+
+    parser.add_argument("--schedule", choices=["size", "fifo"], default="size", help="size hands the pages out to the workers biggest first, \
+                        in batches of about --batchBytes, so there are no big pages left over at the end of the run. fifo hands them out \
+                        in order, --chunksize at a time")
+
+    parser.add_argument("--batchBytes", type=int, default=512 * 1024, help="the most bytes of html that go in one batch with --schedule size, \
+                        the batches get smaller towards the end of the run")
+
+    parser.add_argument("--chunksize", type=int, default=1, help="how many pages get sent to a worker process at a time with --schedule fifo. \
+                        Bigger chunks mean less communication between the processes but worse load balancing at the end of the run")
+
+    parser.add_argument("--archive", action="store_true", default=False, help="write the docset as one as3.docset.tgz file instead of \
+                        a folder of thousands of files, with an index next to it so single pages can be read out of it quickly. \
+                        Every file in it gets the time in SOURCE_DATE_EPOCH (or 0), so building the same docset again gives the same archive. \
+                        Needs --sqliteIndex or --noDocsetutil")
+
+    parser.add_argument("--minify", action="store_true", default=False, help="make the pages smaller by removing the javascript \
+                        event handlers and frameset scripts that don't work in Dash, unused <style> rules and extra whitespace (except in <pre>). \
+                        Writes a report of the bytes saved per page next to the docset. Changing this needs a full build, --incremental \
+                        only redoes the pages whose source changed")
+
+    parser.add_argument("--linkStatic", action="store_true", default=False, help="hardlink the static files (css, images, etc) \
+                        into the docset instead of copying them, when the docset is on the same filesystem as the documentation")
+
+    parser.add_argument("--assetStore", help="a folder where the static files (css, images, etc) are stored once by their contents \
+                        and hardlinked into the docset. Use the same folder for the docsets of different versions of the documentation and \
+                        they share the files that are the same. Has to be on the same filesystem as the docset, or the files get copied")
+
+    parser.add_argument("--writeQueueSize", type=int, default=0, help="if more than 0, every worker process writes its pages on a background \
+                        thread, so it can parse the next page while the last one is being written, and this many pages can be waiting to be written. \
+                        Only worth it when the docset is on slow or network storage. By default (0) every page is written before starting the next one")
 
     parser.add_argument("--deleteExisting", action="store_true", default=False, help="Whether or not to delete any existing output folders that may \
                         already exist in the specified outputPath, or to error out and exit")
 
-    args = parser.parse_args()
+    parser.add_argument("--incremental", action="store_true", default=False, help="update an existing docset instead of making a new one, \
+                        only the pages whose html changed since the last build get scraped again, the tokens for the rest come from \
+                        the manifest file that every build writes next to the docset")
+
+    parser.add_argument("--maxErrors", type=int, default=None, help="stop the build as soon as more than this many pages fail \
+                        to be scraped, instead of scraping the rest of the pages anyway. By default the build never stops early, \
+                        the exit status is 1 either way if any page failed")
+
+    parser.add_argument("--onlyPages", default=None, help="a file with one page per line, like the .failed.txt file that every \
+                        build writes next to the docset. Only those pages get scraped again, the tokens for the rest of the pages come from \
+                        the manifest of the last build")
+
+    parser.add_argument("--progressInterval", type=float, default=1.0, help="print the progress of the page scraping at most once \
+                        every this many seconds")
+
+    parser.add_argument("--quiet", action="store_true", default=False, help="don't print the progress of the page scraping at all")
+
+    parser.add_argument("--serve", action="store_true", default=False, help="instead of making a docset, serve the documentation \
+                        over http and rewrite every page the first time its asked for, with a json search of the tokens found so far at /search?q=")
+
+    parser.add_argument("--port", type=int, default=8000, help="the port that --serve listens on")
+
+    parser.add_argument("--serveCacheSize", type=int, default=64, help="how many megabytes of rewritten pages --serve keeps in memory, \
+                        the rest are read back from disk")
+
+    parser.add_argument("--profile", action="store_true", default=False, help="record the wall time, cpu time and peak memory of every \
+                        phase of the build and how long every page took to parse, extract, modify, serialize and write. Writes a json report \
+                        next to the docset and prints the slowest pages")
+
+    parser.add_argument("--profileTopN", type=int, default=20, help="how many of the slowest pages --profile prints, and how many of the pages --minify saved the most on")
 
+    parser.add_argument("--profileWorkers", action="store_true", default=False, help="run every worker process under cProfile \
+                        and save the stats to a folder next to the docset, one file per worker")
+
+    return parser
+
+if __name__ == "__main__":
+    # if we are being run as a real program
+
+    # the script does NOT seem to work if lxml is not installed
+    # bs4 needs lxml or else it wont be able to find elements for 
+    # some reason!
     try:
-        makeDocset(args)
+        import lxml
+    except ImportError as e:
+
+        trouble("lxml is not installed! the script does not seem to work without lxml, see www.lxml.de. Error: {}".format(e))
+
+    args = getArgumentParser().parse_args()
+
+    try:
+        if args.serve:
+            serveDocs(args)
+        else:
+            makeDocset(args)
     except Exception as e:
 
         trouble("problem making the docset: error was: {}".format(e))
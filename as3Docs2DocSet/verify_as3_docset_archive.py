@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+#
+# checks a docset archive made by create_as3_docset.py --archive against a normal build of the same
+# documentation (made without --archive). Reads random files out of the archive with the index, the same way
+# something that only wants one page would, and compares them to the files in the docset folder.
+#
+# https://github.com/mgrandi/PythonScripts
+#
+
+import os
+import os.path
+import sys
+import argparse
+import random
+import tarfile
+
+import create_as3_docset
+
+
+def verifyArchive(archivePath, docsetPath, numberOfSamples, seed):
+    ''' compares random files from the archive with the same files in the docset folder
+    @param archivePath - the as3.docset.tgz file
+    @param docsetPath - the as3.docset folder of a build without --archive
+    @param numberOfSamples - how many files to compare
+    @param seed - the seed for picking the files, so a failure can be repeated
+    @return the number of files that were different or missing'''
+
+    archiveIndex = create_as3_docset.loadArchiveIndex(archivePath)
+
+    # only the files in Documents, the docset files are different when the folder build ran docsetutil
+    prefix = create_as3_docset.archiveDocumentsFolder + "/"
+    nameList = sorted(name for name in archiveIndex.keys() if name.startswith(prefix))
+    sampleList = random.Random(seed).sample(nameList, min(numberOfSamples, len(nameList)))
+
+    problems = 0
+
+    for archiveName in sampleList:
+
+        filePath = os.path.join(os.path.dirname(os.path.abspath(docsetPath)), *archiveName.split("/"))
+        data = create_as3_docset.readArchiveMember(archivePath, archiveIndex, archiveName)
+
+        if not os.path.exists(filePath):
+            print("[ERROR]: {} is in the archive but not in {}".format(archiveName, docsetPath))
+            problems += 1
+            continue
+
+        with open(filePath, "rb") as f:
+            expected = f.read()
+
+        if data != expected:
+            print("[ERROR]: {} is different in the archive ({} bytes) and in the docset folder ({} bytes)".format(archiveName,
+                len(data), len(expected)))
+            problems += 1
+
+    print("Compared {} of the {} pages in the archive, {} were different".format(len(sampleList), len(nameList), problems))
+
+    return problems
+
+def verifyArchiveFormat(archivePath):
+    ''' reads the whole archive with the tarfile module, to make sure its a normal .tgz file and
+    that it has the same files as the index
+    @param archivePath - the as3.docset.tgz file
+    @return the number of files that are in one but not the other'''
+
+    archiveIndex = create_as3_docset.loadArchiveIndex(archivePath)
+
+    with tarfile.open(archivePath, "r:gz") as tar:
+        nameSet = set(tar.getnames())
+
+    problems = nameSet.symmetric_difference(archiveIndex.keys())
+
+    for name in sorted(problems):
+        print("[ERROR]: {} is in {}".format(name, "the archive but not the index" if name in nameSet else "the index but not the archive"))
+
+    print("The archive has {} files and the index has {}".format(len(nameSet), len(archiveIndex)))
+
+    return len(problems)
+
+
+if __name__ == "__main__":
+    # if we are being run as a real program
+
+    parser = argparse.ArgumentParser(description="check a docset archive from create_as3_docset.py --archive against a normal build",
+        epilog="Copyright 2012 Mark Grandi")
+
+    parser.add_argument("archivePath", help="the as3.docset.tgz file")
+
+    parser.add_argument("docsetPath", help="the as3.docset folder of a build of the same documentation without --archive, with the same --parser")
+
+    parser.add_argument("--samples", type=int, default=50, help="how many random pages to compare")
+
+    parser.add_argument("--seed", type=int, default=0, help="the seed for picking the random pages")
+
+    parser.add_argument("--full", action="store_true", default=False, help="also read the whole archive with the tarfile module and \
+                        make sure it has the same files as the index")
+
+    args = parser.parse_args()
+
+    try:
+        problems = verifyArchive(args.archivePath, args.docsetPath, args.samples, args.seed)
+
+        if args.full:
+            problems += verifyArchiveFormat(args.archivePath)
+
+    except Exception as e:
+
+        create_as3_docset.trouble("problem verifying the archive: error was: {}".format(e))
+
+    sys.exit(1 if problems else 0)